@@ -0,0 +1,160 @@
+from array import array
+from collections import deque
+
+from .cache import TTLCache
+
+
+class SenderState:
+    """
+    单个群成员的刷屏检测状态。
+    只记录上一条消息的时间和“相邻间隔都小于阈值”的连续消息条数，
+    连续条数达到阈值即等价于最近若干条消息的相邻间隔都小于阈值。
+    """
+
+    __slots__ = ("last_ts", "streak", "last_banned")
+
+    def __init__(self):
+        self.last_ts = float("-inf")
+        self.streak = 0
+        self.last_banned = 0.0
+
+    def hit(self, ts: float, interval: float) -> int:
+        """记录一条消息，返回当前连续刷屏的消息条数"""
+        if ts - self.last_ts < interval:
+            self.streak += 1
+        else:
+            self.streak = 1
+        self.last_ts = ts
+        return self.streak
+
+    def clear(self):
+        self.last_ts = float("-inf")
+        self.streak = 0
+
+
+class SpamTracker:
+    """
+    刷屏检测状态的存储。
+    按 (群号, 成员) 保存状态，长时间不发言的成员过期淘汰，总条目数有上限。
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self._states: TTLCache[tuple[str, str], SenderState] = TTLCache(
+            maxsize=maxsize, ttl=ttl
+        )
+
+    def get(self, group_id: str, sender_id: str) -> SenderState:
+        """获取成员状态，不存在则新建；每次获取都会刷新其过期时间"""
+        key = (group_id, sender_id)
+        state = self._states.get(key, refresh=True)
+        if state is None:
+            state = SenderState()
+            self._states.set(key, state)
+        return state
+
+    def __len__(self) -> int:
+        """当前存活的成员状态数"""
+        return len(self._states)
+
+
+class DuplicateDetector:
+    """
+    重复内容检测。
+    消息文本归一化后取指纹，在时间窗口内按 (群, 成员, 指纹) 和 (群, 指纹) 两个索引计数，
+    分别用于发现单人慢速重复发广告和多人（小号）发送相同内容。
+    """
+
+    def __init__(self, window: float, maxsize: int = 20000):
+        # 条目自首次出现起 window 秒后过期，不因重复出现而续期
+        self._senders: TTLCache[tuple[str, str, int], deque[str]] = TTLCache(
+            maxsize=maxsize, ttl=window
+        )
+        self._groups: TTLCache[tuple[str, int], deque[tuple[str, str]]] = TTLCache(
+            maxsize=maxsize, ttl=window
+        )
+
+    def hit(
+        self,
+        group_id: str,
+        sender_id: str,
+        fingerprint: int,
+        message_id: str,
+        sender_limit: int,
+        group_limit: int,
+    ) -> list[tuple[str, str]]:
+        """
+        记录一条消息，若达到重复阈值则返回需要处理的 (成员, 消息ID) 列表并清空对应计数。
+        阈值为 0 表示不启用对应的检测。
+        """
+        if sender_limit > 0:
+            key = (group_id, sender_id, fingerprint)
+            ids = self._senders.get(key)
+            if ids is None or ids.maxlen != sender_limit:
+                ids = deque(maxlen=sender_limit)
+                self._senders.set(key, ids)
+            ids.append(message_id)
+            if len(ids) >= sender_limit:
+                self._senders.pop(key)
+                return [(sender_id, mid) for mid in ids]
+
+        if group_limit > 0:
+            gkey = (group_id, fingerprint)
+            hits = self._groups.get(gkey)
+            if hits is None or hits.maxlen != group_limit:
+                hits = deque(maxlen=group_limit)
+                self._groups.set(gkey, hits)
+            hits.append((sender_id, message_id))
+            if len(hits) >= group_limit:
+                self._groups.pop(gkey)
+                return list(hits)
+        return []
+
+    def __len__(self) -> int:
+        """当前存活的指纹条目数"""
+        return len(self._senders) + len(self._groups)
+
+
+class _FloodRing:
+    """按秒计数的定长环形缓冲区"""
+
+    __slots__ = ("counts", "seconds")
+
+    def __init__(self, window: int):
+        self.counts = array("I", bytes(4 * window))
+        # 每个槽位当前计数所属的秒，用于判断槽位是否已过期
+        self.seconds = array("q", bytes(8 * window))
+
+    def hit(self, now: float) -> int:
+        """记录一条消息，返回窗口内的消息总数"""
+        window = len(self.counts)
+        sec = int(now)
+        idx = sec % window
+        if self.seconds[idx] != sec:
+            self.seconds[idx] = sec
+            self.counts[idx] = 0
+        self.counts[idx] += 1
+        oldest = sec - window
+        return sum(
+            c for c, s in zip(self.counts, self.seconds) if s > oldest
+        )
+
+
+class GroupFloodTracker:
+    """
+    群整体消息速率统计。
+    每个群一个按秒计数的环形缓冲区，用于发现多个账号各自未超限、合计却在刷屏的情况。
+    """
+
+    def __init__(self, window: int):
+        self.window = max(1, int(window))
+        self._rings: dict[str, _FloodRing] = {}
+
+    def hit(self, group_id: str, now: float) -> int:
+        """记录一条消息，返回该群最近 window 秒内的消息数"""
+        ring = self._rings.get(group_id)
+        if ring is None:
+            ring = self._rings[group_id] = _FloodRing(self.window)
+        return ring.hit(now)
+
+    def reset(self, group_id: str):
+        self._rings.pop(group_id, None)
@@ -0,0 +1,45 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    布隆过滤器。
+    判断“不在集合中”是确定的，判断“在集合中”有 error_rate 左右的误判，
+    因此只用作精确查询前的快速筛选：绝大多数不在集合中的元素只需几次哈希探测即可排除。
+    不支持删除，元素数超过 capacity 后误判率上升，需要由调用方按更大容量重建。
+    """
+
+    __slots__ = ("capacity", "error_rate", "count", "_size", "_hashes", "_bits")
+
+    def __init__(self, capacity: int = 1024, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.count = 0
+        # 最优位数 m = -n·ln(p) / ln(2)²，最优哈希数 k = m/n·ln(2)
+        bits = -self.capacity * math.log(error_rate) / math.log(2) ** 2
+        self._size = max(8, math.ceil(bits))
+        self._hashes = max(1, round(self._size / self.capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _positions(self, item: str):
+        # 双重哈希：用一次摘要的两半模拟 k 个独立哈希
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self._size
+        return ((h1 + i * h2) % size for i in range(self._hashes))
+
+    def add(self, item: str):
+        bits = self._bits
+        for pos in self._positions(item):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self) -> int:
+        """已加入的元素数（含重复加入）"""
+        return self.count
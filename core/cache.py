@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import time
+from typing import Callable, Generic, Hashable, Iterator, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class _Entry(Generic[V]):
+    __slots__ = ("value", "expires")
+
+    def __init__(self, value: V, expires: float):
+        self.value = value
+        self.expires = expires
+
+
+class TTLCache(Generic[K, V]):
+    """
+    带过期时间与容量上限的缓存。
+    条目超过 ttl 未刷新即过期，条目数超过 maxsize 时淘汰最早过期的条目。
+    条目按过期时间排列（写入或刷新时移到队尾），过期条目在访问时惰性删除，
+    写入时顺带从队头清理一批。
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: OrderedDict[K, _Entry[V]] = OrderedDict()
+
+    def get(self, key: K, default: V | None = None, refresh: bool = False) -> V | None:
+        """读取条目；refresh 为 True 时顺带延长其过期时间"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        now = self._clock()
+        if entry.expires <= now:
+            del self._data[key]
+            return default
+        if refresh:
+            entry.expires = now + self.ttl
+            self._data.move_to_end(key)
+        # 不刷新时保持原位，否则队头不再是最早过期的条目，清理会被存活条目挡住
+        return entry.value
+
+    def set(self, key: K, value: V, ttl: float | None = None):
+        """写入条目；指定的 ttl 短于默认值时，该条目可能晚于过期时间才被队头清理"""
+        now = self._clock()
+        expires = now + (self.ttl if ttl is None else ttl)
+        entry = self._data.get(key)
+        if entry is None:
+            self._data[key] = _Entry(value, expires)
+        else:
+            entry.value = value
+            entry.expires = expires
+            self._data.move_to_end(key)
+        self._evict(now)
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry.value
+
+    def clear(self):
+        self._data.clear()
+
+    def sweep(self) -> int:
+        """清理队头的过期条目，返回清理数量"""
+        return self._evict(self._clock())
+
+    def _evict(self, now: float) -> int:
+        removed = 0
+        data = self._data
+        while data:
+            key, entry = next(iter(data.items()))
+            if len(data) > self.maxsize or entry.expires <= now:
+                del data[key]
+                removed += 1
+            else:
+                break
+        return removed
+
+    def __contains__(self, key: K) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry.expires > self._clock()
+
+    def __len__(self) -> int:
+        """当前存活的条目数"""
+        self.sweep()
+        return len(self._data)
+
+    def keys(self) -> Iterator[K]:
+        now = self._clock()
+        return iter([k for k, e in self._data.items() if e.expires > now])
@@ -1,256 +1,373 @@
 import asyncio
-from datetime import datetime, time, timedelta, timezone
+from datetime import datetime, timedelta, timezone
+import heapq
 import json
 from pathlib import Path
+import time as time_module
 from typing import Optional
 
 from aiocqhttp import CQHttp
 from astrbot import logger
 
+from .curfew_schedule import CurfewSchedule
+from .sqlite_store import SQLiteStore
+from .utils import RateLimiter
+
 # 创建北京时区对象 (UTC+8)
 BEIJING_TIMEZONE = timezone(timedelta(hours=8))
 CURFEW_DATA_PATH = Path("data/curfew_tasks.json")
+# 切换重试耗尽后，隔多久再次尝试（秒）
+CURFEW_RETRY_DELAY = 60
 
 class Curfew:
     """
     管理群组宵禁功能的类。
-    每个 CurfewManager 实例负责一个群组的宵禁状态和调度。
+    每个 Curfew 实例负责一个群组的宵禁时段与全体禁言状态，调度由 CurfewManager 统一进行。
     """
 
     def __init__(
         self,
         bot: CQHttp,
         group_id: str,
-        start_time_str: str,
-        end_time_str: str,
+        schedule: CurfewSchedule,
     ):
         self.bot = bot
         self.group_id = group_id
-        self._start_time_str = start_time_str
-        self._end_time_str = end_time_str
-        self.curfew_task: Optional[asyncio.Task] = None
+        self.schedule = schedule
         self.whole_ban_status: bool = False
-        self._active = False  # 添加活动状态标志
-
-        try:
-            # 解析为无时区的time对象
-            self.start_time: time = datetime.strptime(start_time_str, "%H:%M").time()
-            self.end_time: time = datetime.strptime(end_time_str, "%H:%M").time()
-        except ValueError as e:
-            logger.error(f"宵禁时间格式错误 for group {group_id}: {e}", exc_info=True)
-            raise ValueError("宵禁时间格式必须是 HH:MM") from e
 
         logger.info(
-            f"群 {self.group_id} 的宵禁管理器初始化成功，北京时间段：{start_time_str}~{end_time_str}"
-        )
-
-    def is_running(self) -> bool:
-        """检查宵禁任务是否正在运行。"""
-        return self.curfew_task is not None and not self.curfew_task.done()
-
-    async def start_curfew_task(self):
-        """启动宵禁后台调度任务。"""
-        if self.is_running():
-            logger.warning(f"群 {self.group_id} 的宵禁任务已在运行，无需重复启动。")
-            return
-
-        if self._active:
-            logger.warning(f"群 {self.group_id} 的宵禁任务已激活，无需重复启动。")
-            return
-
-        self._active = True
-        self.curfew_task = asyncio.create_task(self._scheduler_loop())
-        logger.info(f"群 {self.group_id} 的宵禁任务已启动。")
-
-    async def stop_curfew_task(self):
-        """停止宵禁后台调度任务。"""
-        if not self._active:
-            logger.warning(f"群 {self.group_id} 的宵禁任务未运行，无需停止。")
-            return
-
-        self._active = False
-
-        if self.curfew_task and not self.curfew_task.done():
-            self.curfew_task.cancel()
-            try:
-                await self.curfew_task  # 等待任务完成取消
-            except asyncio.CancelledError:
-                logger.info(f"群 {self.group_id} 的宵禁任务已成功取消。")
-            except Exception as e:
-                logger.error(
-                    f"停止群 {self.group_id} 宵禁任务时发生异常: {e}", exc_info=True
-                )
-        self.curfew_task = None
-        logger.info(f"群 {self.group_id} 的宵禁任务已停止。")
-
-    async def _scheduler_loop(self):
-        """宵禁后台调度器，使用时间差计算代替循环检查"""
-        logger.info(
-            f"群 {self.group_id} 宵禁调度循环开始，北京时间段：{self.start_time.strftime('%H:%M')}~{self.end_time.strftime('%H:%M')}"
+            f"群 {self.group_id} 的宵禁管理器初始化成功，北京时间段：{schedule}"
         )
 
-        try:
-            while self._active:
-                # 获取当前北京时间 (UTC+8)
-                current_dt = datetime.now(BEIJING_TIMEZONE)
-                current_date = current_dt.date()
-                if self.start_time >= self.end_time:
-                    # 跨天宵禁逻辑
-                    if current_dt.time() < self.end_time:
-                        # 当前在第二天的凌晨，起始时间应为昨天
-                        start_dt = datetime.combine(current_date - timedelta(days=1), self.start_time)
-                        end_dt = datetime.combine(current_date, self.end_time)
-                    else:
-                        # 当前在第一天晚上，结束时间为第二天
-                        start_dt = datetime.combine(current_date, self.start_time)
-                        end_dt = datetime.combine(current_date + timedelta(days=1), self.end_time)
-                else:
-                    # 不跨天，直接使用当天的时间
-                    start_dt = datetime.combine(current_date, self.start_time)
-                    end_dt = datetime.combine(current_date, self.end_time)
-
-                # 设置为北京时区
-                start_dt = start_dt.replace(tzinfo=BEIJING_TIMEZONE)
-                end_dt = end_dt.replace(tzinfo=BEIJING_TIMEZONE)
-
-                # 判断是否在宵禁时段内
-                is_during_curfew = start_dt <= current_dt < end_dt
-
-                # 计算下次检查时间 - 使用更智能的时间差计算
-                if is_during_curfew:
-                    next_check = min(end_dt - current_dt, timedelta(seconds=60))
-                    if not self.whole_ban_status:
-                        await self._enable_curfew()
-                else:
-                    # 计算到宵禁开始的时间
-                    if current_dt < start_dt:
-                        next_check = start_dt - current_dt
-                    else:
-                        # 如果当前时间已超过结束时间，计算到明天的开始时间
-                        next_check = (start_dt + timedelta(days=1)) - current_dt
-
-                    if self.whole_ban_status:
-                        await self._disable_curfew()
-
-                # 确保等待时间至少1秒，不超过1小时
-                sleep_time = max(
-                    timedelta(seconds=1), min(next_check, timedelta(hours=1))
-                )
-                await asyncio.sleep(sleep_time.total_seconds())
-
-        except asyncio.CancelledError:
-            # 任务被取消，正常退出
-            logger.info(f"群 {self.group_id} 的宵禁任务被取消")
-            raise
-        except Exception as e:
-            logger.error(
-                f"群 {self.group_id} 宵禁任务发生未处理异常: {e}", exc_info=True
-            )
-        finally:
-            self._active = False
-            self.curfew_task = None
-
-    async def _enable_curfew(self):
-        """启用宵禁（内部方法）"""
+    def is_during_curfew(self, now: datetime) -> bool:
+        return self.schedule.is_active(now)
+
+    def next_transition(self, now: datetime) -> datetime:
+        """下一次宵禁开始或结束的时间"""
+        return self.schedule.next_transition(now)
+
+    async def apply(self, now: datetime):
+        """使群的全体禁言状态与当前是否处于宵禁时段一致"""
+        if self.is_during_curfew(now):
+            if not self.whole_ban_status:
+                await self._enable_curfew(self.schedule.current_label(now))
+        elif self.whole_ban_status:
+            await self._disable_curfew(self.schedule.current_label(now))
+
+    async def _enable_curfew(self, label: str):
+        """启用宵禁（内部方法），全体禁言失败时抛出异常以便重试"""
+        await self.bot.set_group_whole_ban(group_id=int(self.group_id), enable=True)
+        self.whole_ban_status = True
+        logger.info(f"群 {self.group_id} 已开启全体禁言。")
+        # 公告失败不影响禁言状态，也不重试，避免重复公告
         try:
             await self.bot.send_group_msg(
                 group_id=int(self.group_id),
-                message=f"【{self.start_time.strftime('%H:%M')}】本群宵禁开始！",
+                message=f"【{label}】本群宵禁开始！",
             )
-            await self.bot.set_group_whole_ban(group_id=int(self.group_id), enable=True)
-            self.whole_ban_status = True
-            logger.info(f"群 {self.group_id} 已开启全体禁言。")
         except Exception as e:
-            logger.error(f"群 {self.group_id} 宵禁开启失败: {e}", exc_info=True)
+            logger.warning(f"群 {self.group_id} 宵禁开始公告发送失败: {e}")
 
-    async def _disable_curfew(self):
-        """禁用宵禁（内部方法）"""
+    async def _disable_curfew(self, label: str):
+        """禁用宵禁（内部方法），解除全体禁言失败时抛出异常以便重试"""
+        await self.bot.set_group_whole_ban(group_id=int(self.group_id), enable=False)
+        self.whole_ban_status = False
+        logger.info(f"群 {self.group_id} 已解除全体禁言。")
         try:
             await self.bot.send_group_msg(
                 group_id=int(self.group_id),
-                message=f"【{self.end_time.strftime('%H:%M')}】本群宵禁结束！",
-            )
-            await self.bot.set_group_whole_ban(
-                group_id=int(self.group_id), enable=False
+                message=f"【{label}】本群宵禁结束！",
             )
-            self.whole_ban_status = False
-            logger.info(f"群 {self.group_id} 已解除全体禁言。")
         except Exception as e:
-            logger.error(f"群 {self.group_id} 宵禁解除失败: {e}", exc_info=True)
+            logger.warning(f"群 {self.group_id} 宵禁结束公告发送失败: {e}")
 
 
 class CurfewManager:
-    """统一管理群宵禁任务及其持久化"""
+    """
+    统一管理群宵禁任务及其持久化。
+    所有群共用一个调度任务：用最小堆保存各群下一次状态切换的时间，
+    调度任务只睡到最早的切换时刻，把到期的群放入队列，
+    由固定数量的工作协程按每秒限额执行切换，失败的切换会重试。
+    """
 
-    def __init__(self, bot):
+    def __init__(
+        self,
+        bot,
+        concurrency: int = 5,
+        rate: float = 5,
+        max_retries: int = 3,
+        store: SQLiteStore | None = None,
+    ):
         self.bot = bot
+        # 指定 store 时宵禁数据存入 SQLite，否则存入 CURFEW_DATA_PATH
+        self.store = store
         self.tasks: dict[str, Curfew] = {}
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self._limiter = RateLimiter(rate)
+        # 已入队或正在执行切换的群
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._pending: set[str] = set()
+        # 处理期间再次到期的群，当前切换结束后重新入队
+        self._redispatch: set[str] = set()
+        # 最近一次切换在重试后仍失败的群
+        self.failed: set[str] = set()
+        self._workers: list[asyncio.Task] = []
+        # 任务或禁言状态发生变化、需要持久化的群
+        self._dirty: set[str] = set()
+        # 最小堆 (切换时间戳, 群号)；群的当前有效切换时间记录在 _due 中，
+        # 堆中时间不一致的条目视为已作废，出堆时丢弃
+        self._heap: list[tuple[float, str]] = []
+        self._due: dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        self._scheduler_task: Optional[asyncio.Task] = None
         self.load_tasks()
+        self._start_scheduler()
+
+    def _start_scheduler(self):
+        if self._scheduler_task is None or self._scheduler_task.done():
+            self._scheduler_task = asyncio.create_task(self._scheduler_loop())
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker_loop()))
+
+    def _schedule(self, group_id: str, when: float):
+        """登记群的下一次切换时间，O(log n)"""
+        self._due[group_id] = when
+        heapq.heappush(self._heap, (when, group_id))
+        if self._heap[0] == (when, group_id):
+            # 新条目成为最早的切换，唤醒调度任务重新计算睡眠时长
+            self._wakeup.set()
+
+    def _unschedule(self, group_id: str):
+        """取消群的调度，堆中的旧条目在出堆时丢弃"""
+        self._due.pop(group_id, None)
+        # 作废条目过多时重建堆，避免堆无限增长
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(t, g) for g, t in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_stale(self):
+        heap = self._heap
+        while heap and self._due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
 
-    def load_tasks(self):
-        """从JSON加载所有宵禁任务（用于重启恢复）"""
+    async def _scheduler_loop(self):
+        """宵禁调度器：睡到最早的切换时刻，处理所有到期的群"""
+        logger.info("宵禁调度任务已启动。")
+        try:
+            while True:
+                self._pop_stale()
+                self._wakeup.clear()
+                if not self._heap:
+                    await self._wakeup.wait()
+                    continue
+                delay = self._heap[0][0] - time_module.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                now_ts = time_module.time()
+                due: list[str] = []
+                while self._heap and self._heap[0][0] <= now_ts:
+                    when, group_id = heapq.heappop(self._heap)
+                    if self._due.get(group_id) == when:
+                        del self._due[group_id]
+                        due.append(group_id)
+                for group_id in due:
+                    self._dispatch(group_id)
+        except asyncio.CancelledError:
+            logger.info("宵禁调度任务被取消")
+            raise
+        except Exception as e:
+            logger.error(f"宵禁调度任务发生未处理异常: {e}", exc_info=True)
+
+    def _dispatch(self, group_id: str):
+        """把到期的群放入切换队列，已在队列中的群标记为处理完后重新入队"""
+        if group_id in self._pending:
+            self._redispatch.add(group_id)
+            return
+        self._pending.add(group_id)
+        self._queue.put_nowait(group_id)
+
+    async def _worker_loop(self):
+        """切换工作协程：从队列取出群并执行状态切换"""
+        while True:
+            group_id = await self._queue.get()
+            try:
+                await self._run_transition(group_id)
+            except asyncio.CancelledError:
+                # 停止时不再重新入队，直接退出
+                self._redispatch.discard(group_id)
+                self._pending.discard(group_id)
+                raise
+            except Exception as e:
+                logger.error(f"群 {group_id} 宵禁切换异常: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+            if group_id in self._redispatch:
+                self._redispatch.discard(group_id)
+                self._queue.put_nowait(group_id)
+                continue
+            self._pending.discard(group_id)
+            if not self._pending:
+                self._report()
+                # 一批切换处理完后统一保存一次禁言状态
+                if self._dirty:
+                    self.save_tasks()
+
+    def _report(self):
+        """一批切换全部处理完后报告仍未成功的群"""
+        if self.failed:
+            logger.error(
+                f"以下群的宵禁状态切换失败，将在{CURFEW_RETRY_DELAY}秒后重试：{sorted(self.failed)}"
+            )
+
+    def pending_groups(self) -> list[str]:
+        """尚未完成状态切换的群"""
+        return sorted(self._pending)
+
+    async def _run_transition(self, group_id: str):
+        """执行一个群的状态切换（失败重试），并登记其下一次切换"""
+        cw = self.tasks.get(group_id)
+        if cw is None:
+            return
+        for attempt in range(self.max_retries + 1):
+            await self._limiter.acquire()
+            if self.tasks.get(group_id) is not cw:
+                self._reschedule_replaced(group_id)
+                return
+            now = datetime.now(BEIJING_TIMEZONE)
+            status = cw.whole_ban_status
+            try:
+                await cw.apply(now)
+                break
+            except Exception as e:
+                logger.warning(
+                    f"群 {group_id} 宵禁状态切换失败（第{attempt + 1}次）: {e}"
+                )
+                if attempt < self.max_retries:
+                    await asyncio.sleep(2**attempt)
+        else:
+            # 重试耗尽，稍后重新检查，保证不会有群一直停留在错误状态
+            if self.tasks.get(group_id) is cw:
+                self.failed.add(group_id)
+                self._schedule(group_id, time_module.time() + CURFEW_RETRY_DELAY)
+            else:
+                self.failed.discard(group_id)
+                self._reschedule_replaced(group_id)
+            return
+
+        self.failed.discard(group_id)
+        if cw.whole_ban_status != status:
+            self._dirty.add(group_id)
+        if self.tasks.get(group_id) is cw:
+            self._schedule(group_id, cw.next_transition(now).timestamp())
+        else:
+            self._reschedule_replaced(group_id)
+
+    def _reschedule_replaced(self, group_id: str):
+        """切换期间群的宵禁被替换：立即检查新的宵禁，避免新任务没有被调度"""
+        if group_id in self.tasks:
+            self._schedule(group_id, time_module.time())
+
+    def _add(self, cw: Curfew):
+        """
+        加入一个群的宵禁并立即检查一次当前状态。
+        只有记录的禁言状态与当前时段不符时才会真正调用接口。
+        """
+        self.tasks[cw.group_id] = cw
+        self._schedule(cw.group_id, time_module.time())
+
+    def _read_tasks(self) -> dict[str, dict] | None:
+        if self.store:
+            return self.store.load_curfews()
         if not CURFEW_DATA_PATH.exists():
             logger.info("未找到宵禁数据文件，跳过加载。")
-            return
+            return None
+        with open(CURFEW_DATA_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
 
+    def load_tasks(self):
+        """加载所有宵禁任务及上次的禁言状态（用于重启恢复）"""
         try:
-            with open(CURFEW_DATA_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = self._read_tasks()
         except Exception as e:
             logger.error(f"加载宵禁任务失败：{e}", exc_info=True)
             return
+        if not data:
+            return
 
         for group_id, times in data.items():
             try:
                 cw = Curfew(
                     bot=self.bot,
                     group_id=group_id,
-                    start_time_str=times["start_time"],
-                    end_time_str=times["end_time"],
+                    schedule=CurfewSchedule.from_dict(times),
                 )
-                self.tasks[group_id] = cw
-                asyncio.create_task(cw.start_curfew_task())
+                cw.whole_ban_status = bool(times.get("whole_ban", False))
+                self._add(cw)
                 logger.info(f"群 {group_id} 的宵禁任务已恢复。")
             except Exception as e:
                 logger.error(f"恢复群 {group_id} 的宵禁任务失败：{e}", exc_info=True)
 
+    @staticmethod
+    def _task_dict(cw: Curfew) -> dict:
+        return {**cw.schedule.to_dict(), "whole_ban": cw.whole_ban_status}
+
     def save_tasks(self):
-        """将当前所有任务信息保存到JSON"""
+        """保存宵禁任务：SQLite 只写有变化的群，JSON 整体重写"""
         try:
-            CURFEW_DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-            with open(CURFEW_DATA_PATH, "w", encoding="utf-8") as f:
-                json.dump(
+            if self.store:
+                self.store.save_curfews(
                     {
-                        gid: {
-                            "start_time": cm._start_time_str,
-                            "end_time": cm._end_time_str,
-                        }
-                        for gid, cm in self.tasks.items()
-                    },
-                    f,
-                    ensure_ascii=False,
-                    indent=2,
+                        gid: self._task_dict(cw) if (cw := self.tasks.get(gid)) else None
+                        for gid in self._dirty
+                    }
                 )
+            else:
+                CURFEW_DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
+                with open(CURFEW_DATA_PATH, "w", encoding="utf-8") as f:
+                    json.dump(
+                        {gid: self._task_dict(cw) for gid, cw in self.tasks.items()},
+                        f,
+                        ensure_ascii=False,
+                        indent=2,
+                    )
+            self._dirty.clear()
             logger.info("宵禁任务数据已保存。")
         except Exception as e:
             logger.error(f"保存宵禁任务失败：{e}", exc_info=True)
 
     async def stop_all_tasks(self):
-        """关闭并保存所有宵禁任务"""
-        for cw in self.tasks.values():
-            await cw.stop_curfew_task()
+        """关闭调度任务并保存所有宵禁任务"""
+        if self._pending:
+            logger.warning(f"以下群的宵禁状态切换尚未完成：{self.pending_groups()}")
+        for task in [self._scheduler_task, *self._workers]:
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._scheduler_task = None
+        self._workers = []
         self.save_tasks()
 
-    async def enable_curfew(
-        self, group_id: str, start_time: str, end_time: str
-    ):
+    async def enable_curfew(self, group_id: str, schedule: CurfewSchedule):
         """对外接口：开启一个群的宵禁任务"""
-        if group_id in self.tasks:
-            await self.tasks[group_id].stop_curfew_task()
-
-        cw = Curfew(self.bot, group_id, start_time, end_time)
-        self.tasks[group_id] = cw
-        await cw.start_curfew_task()
+        cw = Curfew(self.bot, group_id, schedule)
+        old = self.tasks.get(group_id)
+        if old:
+            # 沿用旧任务的禁言状态，由调度器按新时段决定是否需要切换
+            cw.whole_ban_status = old.whole_ban_status
+        self._add(cw)
+        self._start_scheduler()
+        self._dirty.add(group_id)
         self.save_tasks()
         logger.info(f"群 {group_id} 的宵禁任务已添加并启动")
 
@@ -259,7 +376,9 @@ class CurfewManager:
         """对外接口：关闭一个群的宵禁任务"""
         cw = self.tasks.pop(group_id, None)
         if cw:
-            await cw.stop_curfew_task()
+            self._unschedule(group_id)
+            self.failed.discard(group_id)
+            self._dirty.add(group_id)
             self.save_tasks()
             logger.info(f"群 {group_id} 的宵禁任务已停止并移除。")
             return True
@@ -0,0 +1,253 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import re
+
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+
+WEEKDAY_NAMES = "一二三四五六日"
+EVERY_DAY = frozenset(range(7))
+
+# 星期别名，0 表示周一
+_DAY_ALIASES: dict[str, frozenset[int]] = {
+    "每天": EVERY_DAY,
+    "每日": EVERY_DAY,
+    "工作日": frozenset(range(5)),
+    "周末": frozenset({5, 6}),
+}
+_WEEKDAY_RE = re.compile(r"(?:周|星期)([一二三四五六日天])")
+_TIME_RE = re.compile(r"^(\d{1,2})[:：](\d{2})$")
+
+
+def _parse_weekday(text: str) -> int | None:
+    m = _WEEKDAY_RE.fullmatch(text)
+    if m:
+        return WEEKDAY_NAMES.index(m.group(1).replace("天", "日"))
+    if text.isdigit() and 1 <= int(text) <= 7:
+        return int(text) - 1
+    return None
+
+
+def parse_days(text: str) -> frozenset[int] | None:
+    """解析星期范围，如“工作日”“周末”“周一至周五”“1-5”“1,3,5”，无法解析返回 None"""
+    if text in _DAY_ALIASES:
+        return _DAY_ALIASES[text]
+    days: set[int] = set()
+    for part in re.split(r"[,，、]", text):
+        bounds = re.split(r"[-~～至到]", part)
+        if len(bounds) == 1:
+            day = _parse_weekday(bounds[0])
+            if day is None:
+                return None
+            days.add(day)
+        elif len(bounds) == 2:
+            first, last = _parse_weekday(bounds[0]), _parse_weekday(bounds[1])
+            if first is None or last is None:
+                return None
+            day = first
+            days.add(day)
+            while day != last:
+                day = (day + 1) % 7
+                days.add(day)
+        else:
+            return None
+    return frozenset(days) or None
+
+
+def parse_time(text: str) -> int:
+    """把 HH:MM 解析为当天的分钟数"""
+    m = _TIME_RE.match(text.strip())
+    if not m or int(m.group(1)) > 23 or int(m.group(2)) > 59:
+        raise ValueError("宵禁时间格式必须是 HH:MM")
+    return int(m.group(1)) * 60 + int(m.group(2))
+
+
+def format_minutes(minutes: int) -> str:
+    minutes %= DAY_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def format_days(days: frozenset[int]) -> str:
+    for alias, value in _DAY_ALIASES.items():
+        if days == value:
+            return alias
+    return "、".join(f"周{WEEKDAY_NAMES[d]}" for d in sorted(days))
+
+
+class CurfewWindow:
+    """一个宵禁时段：在指定的星期几从 start 开始，到 end 结束（end 不晚于 start 表示跨天）"""
+
+    __slots__ = ("days", "start", "end")
+
+    def __init__(self, days: frozenset[int], start: int, end: int):
+        self.days = days
+        self.start = start
+        self.end = end
+
+    def intervals(self) -> list[tuple[int, int]]:
+        """展开为一周内以分钟计的区间 [开始, 结束)，可能超出一周末尾"""
+        duration = (self.end - self.start) % DAY_MINUTES or DAY_MINUTES
+        return [
+            (day * DAY_MINUTES + self.start, day * DAY_MINUTES + self.start + duration)
+            for day in sorted(self.days)
+        ]
+
+    def to_dict(self) -> dict:
+        return {
+            "days": sorted(self.days),
+            "start": format_minutes(self.start),
+            "end": format_minutes(self.end),
+        }
+
+    def __str__(self) -> str:
+        return f"{format_days(self.days)} {format_minutes(self.start)}~{format_minutes(self.end)}"
+
+
+class CurfewSchedule:
+    """
+    每周宵禁计划。
+    所有时段在构造时合并，编译成按一周内分钟偏移排序的切换表，
+    之后判断状态与查找下一次切换都只需一次二分查找。
+    """
+
+    def __init__(self, windows: list[CurfewWindow]):
+        if not windows:
+            raise ValueError("至少需要一个宵禁时段")
+        self.windows = windows
+        # 切换表：_offsets[i] 时刻之后的状态为 _states[i]
+        self._offsets: list[int] = []
+        self._states: list[bool] = []
+        # 整周都处于宵禁时没有切换点
+        self._always = False
+        self._compile()
+
+    def _compile(self):
+        intervals: list[tuple[int, int]] = []
+        for window in self.windows:
+            for start, end in window.intervals():
+                if end <= WEEK_MINUTES:
+                    intervals.append((start, end))
+                else:
+                    # 跨过周日午夜的部分折回周一
+                    intervals.append((start, WEEK_MINUTES))
+                    intervals.append((0, end - WEEK_MINUTES))
+        intervals.sort()
+        merged: list[list[int]] = []
+        for start, end in intervals:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        if merged and merged[0][0] == 0 and merged[0][1] >= WEEK_MINUTES:
+            self._always = True
+            return
+        # 首尾相接的区间（周日跨到周一）视为连续，不产生切换
+        wraps = (
+            len(merged) > 1 and merged[0][0] == 0 and merged[-1][1] == WEEK_MINUTES
+        )
+        for i, (start, end) in enumerate(merged):
+            if not (wraps and i == 0):
+                self._offsets.append(start)
+                self._states.append(True)
+            if not (wraps and i == len(merged) - 1):
+                self._offsets.append(end % WEEK_MINUTES)
+                self._states.append(False)
+        order = sorted(range(len(self._offsets)), key=self._offsets.__getitem__)
+        self._offsets = [self._offsets[i] for i in order]
+        self._states = [self._states[i] for i in order]
+
+    @classmethod
+    def daily(cls, start_time_str: str, end_time_str: str) -> "CurfewSchedule":
+        """每天同一时段的宵禁，兼容旧版 start_time/end_time 配置"""
+        return cls(
+            [CurfewWindow(EVERY_DAY, parse_time(start_time_str), parse_time(end_time_str))]
+        )
+
+    @classmethod
+    def parse(cls, tokens: list[str]) -> "CurfewSchedule":
+        """
+        解析命令参数，如 ["工作日", "23:00", "07:00", "周末", "01:00", "09:00"]。
+        星期范围作用于其后的时间对，未指定则为每天。
+        """
+        days = EVERY_DAY
+        times: list[int] = []
+        windows: list[CurfewWindow] = []
+        for token in tokens:
+            token = token.strip()
+            if not token:
+                continue
+            parsed = parse_days(token)
+            if parsed is not None:
+                if times:
+                    raise ValueError("时间需要成对输入：开始时间 结束时间")
+                days = parsed
+                continue
+            times.append(parse_time(token))
+            if len(times) == 2:
+                windows.append(CurfewWindow(days, times[0], times[1]))
+                times = []
+        if times:
+            raise ValueError("时间需要成对输入：开始时间 结束时间")
+        return cls(windows)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CurfewSchedule":
+        """从持久化数据恢复，兼容只有 start_time/end_time 的旧条目"""
+        if "windows" in data:
+            return cls(
+                [
+                    CurfewWindow(
+                        frozenset(w.get("days", EVERY_DAY)),
+                        parse_time(w["start"]),
+                        parse_time(w["end"]),
+                    )
+                    for w in data["windows"]
+                ]
+            )
+        return cls.daily(data["start_time"], data["end_time"])
+
+    def to_dict(self) -> dict:
+        if len(self.windows) == 1 and self.windows[0].days == EVERY_DAY:
+            window = self.windows[0]
+            return {
+                "start_time": format_minutes(window.start),
+                "end_time": format_minutes(window.end),
+            }
+        return {"windows": [w.to_dict() for w in self.windows]}
+
+    def __str__(self) -> str:
+        return "；".join(str(w) for w in self.windows)
+
+    @staticmethod
+    def _week_offset(now: datetime) -> tuple[datetime, float]:
+        week_start = (now - timedelta(days=now.weekday())).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        return week_start, (now - week_start).total_seconds() / 60
+
+    def _index(self, offset: float) -> int:
+        """当前所处切换段的下标，-1 表示位于首个切换点之前（沿用上周最后一段）"""
+        return bisect_right(self._offsets, offset) - 1
+
+    def is_active(self, now: datetime) -> bool:
+        if self._always:
+            return True
+        _, offset = self._week_offset(now)
+        return self._states[self._index(offset)]
+
+    def current_label(self, now: datetime) -> str:
+        """当前所处切换段开始的时间 HH:MM"""
+        if self._always:
+            return format_minutes(self.windows[0].start)
+        _, offset = self._week_offset(now)
+        return format_minutes(self._offsets[self._index(offset)])
+
+    def next_transition(self, now: datetime) -> datetime:
+        """下一次宵禁开始或结束的时间；全天候宵禁时一周后再检查"""
+        if self._always:
+            return now + timedelta(days=7)
+        week_start, offset = self._week_offset(now)
+        i = self._index(offset) + 1
+        if i < len(self._offsets):
+            return week_start + timedelta(minutes=self._offsets[i])
+        return week_start + timedelta(minutes=self._offsets[0] + WEEK_MINUTES)
@@ -0,0 +1,463 @@
+import asyncio
+from collections import deque
+import json
+import math
+import os
+import re
+import time
+from typing import Callable, Iterable
+
+import regex
+from astrbot import logger
+
+
+class AhoCorasick:
+    """
+    多模式串匹配自动机（Aho-Corasick）。
+    由违禁词列表一次性构建，之后对每条消息只需扫描一遍即可找出首个命中的词，
+    单条消息的匹配开销与违禁词数量无关。
+    若指定 normalize，违禁词与待匹配文本都会先经过它归一化，命中时仍返回原始违禁词。
+    """
+
+    __slots__ = ("words", "_keys", "_normalize", "_goto", "_fail", "_out")
+
+    def __init__(
+        self,
+        words: Iterable[str],
+        normalize: Callable[[str], str] | None = None,
+    ):
+        self._normalize = normalize
+        # 按归一化后的形式去重并保持原有顺序，空串没有意义
+        keyed: dict[str, str] = {}
+        for word in words:
+            key = normalize(word) if normalize else word
+            if key and key not in keyed:
+                keyed[key] = word
+        self._keys: list[str] = list(keyed)
+        self.words: list[str] = list(keyed.values())
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # 每个状态能命中的词下标（自身或沿失配链继承），-1 表示无
+        self._out: list[int] = [-1]
+        self._build()
+
+    def _build(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        for idx, word in enumerate(self._keys):
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    fail.append(0)
+                    out.append(-1)
+                    goto[state][ch] = nxt
+                state = nxt
+            if out[state] == -1:
+                out[state] = idx
+
+        # BFS 计算失配指针，并把输出沿失配链向下传递
+        queue = deque(goto[0].values())  # 第一层的失配指针均指向根
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[nxt] == -1:
+                    out[nxt] = out[fail[nxt]]
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __bool__(self) -> bool:
+        return bool(self.words)
+
+    def search(self, text: str) -> str | None:
+        """扫描一遍文本，返回最先命中的违禁词，未命中返回 None"""
+        if not self.words or not text:
+            return None
+        if self._normalize:
+            text = self._normalize(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state] != -1:
+                return self.words[out[state]]
+        return None
+
+
+# 正则只扫描消息的前若干个字符，避免超长消息拖慢事件循环
+REGEX_SCAN_LIMIT = 1000
+# 单次正则扫描的耗时上限（秒），超时由正则引擎直接中止，不会卡住事件循环
+REGEX_TIME_BUDGET = 0.05
+# 累计超时多少次后停用该群的正则规则
+REGEX_MAX_STRIKES = 3
+
+# 嵌套量词，如 (a+)+、(\w*\s?)*，是灾难性回溯的典型写法
+_NESTED_QUANTIFIER = re.compile(r"\((?:[^()\\]|\\.)*[+*}](?:[^()\\]|\\.)*\)[+*{]")
+# 反向引用会与合并后的分组编号冲突
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?P<")
+
+
+# 每段试探文本重复测量的次数，取最小值排除调度、GC 等造成的偶发计时尖峰
+_PROBE_REPEATS = 3
+# 耗时低于该值时计时噪声占比过大，不据此预估增长趋势（秒）
+_PROBE_NOISE_FLOOR = REGEX_TIME_BUDGET / 100
+# 预估耗时超过预算的多少倍才直接拒绝；未超过则实测下一档，由实测结果判定
+_PROJECTION_MARGIN = 3
+
+# 试探文本长度：短文本上逐字递增以捕捉指数级回溯，之后按比例递增到扫描上限
+_PROBE_LENGTHS = (
+    *range(8, 33, 2),
+    *(int(32 * 1.5**i) for i in range(1, 9)),
+    REGEX_SCAN_LIMIT,
+)
+
+
+def _regex_probes(pattern: str, length: int) -> list[str]:
+    """
+    构造用于试探回溯的文本：常见字符及正则自身的字面字符重复若干次，
+    以及去掉最后一个字面字符后循环的“差一点命中”文本（如 加.*微.*信.*号 对应 加微信加微信…），
+    后者能暴露多个 .* 串联造成的多项式级回溯。
+    """
+    literal = "".join(ch for ch in pattern if ch.isalnum()) or "a"
+    probes = [
+        "a" * length + "!",
+        "1" * length + "!",
+        " " * length + "!",
+        "啊" * length + "!",
+        (literal * length)[:length] + "!",
+    ]
+    if len(literal) > 1:
+        probes.append((literal[:-1] * length)[:length] + "!")
+    return probes
+
+
+def _probe_cost(compiled: regex.Pattern, probe: str) -> float:
+    """多次测量取最小值，作为该试探文本的稳定耗时；超出耗时上限时抛出 TimeoutError"""
+    best = math.inf
+    for _ in range(_PROBE_REPEATS):
+        start = time.perf_counter()
+        compiled.search(probe, timeout=REGEX_TIME_BUDGET)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_pattern(pattern: str) -> str | None:
+    """
+    校验正则违禁规则，返回不合格的原因，合格返回 None。
+    先做静态检查，再用逐步加长的试探文本测量耗时，耗时超出预算即拒绝。
+    试探会占用数十到数百毫秒，应放到线程中执行。
+    """
+    try:
+        compiled = regex.compile(pattern, regex.IGNORECASE)
+    except regex.error as e:
+        return f"正则表达式有误：{e}"
+    if _BACKREFERENCE.search(pattern):
+        return "不支持反向引用和命名分组"
+    if _NESTED_QUANTIFIER.search(pattern):
+        return "包含嵌套量词，可能导致灾难性回溯"
+    if compiled.search(""):
+        return "该正则能匹配空文本"
+    # 逐步加长试探文本，并根据耗时增长趋势预估下一档耗时，避免试探本身卡死
+    prev_length, prev_cost = 0, 0.0
+    for i, length in enumerate(_PROBE_LENGTHS):
+        try:
+            cost = max(
+                _probe_cost(compiled, probe)
+                for probe in _regex_probes(pattern, length)
+            )
+        except TimeoutError:
+            return "匹配耗时过长，可能导致灾难性回溯"
+        if cost > REGEX_TIME_BUDGET:
+            return "匹配耗时过长，可能导致灾难性回溯"
+        # 两档耗时都明显高于计时噪声时才按增长趋势预估，避免噪声之比造成误判
+        if (
+            prev_cost >= _PROBE_NOISE_FLOOR
+            and cost >= _PROBE_NOISE_FLOOR
+            and i + 1 < len(_PROBE_LENGTHS)
+        ):
+            next_length = _PROBE_LENGTHS[i + 1]
+            if next_length - length == length - prev_length:
+                # 等差阶段按指数增长预估
+                exponent = 1.0
+            else:
+                # 等比阶段按多项式增长预估
+                exponent = math.log(next_length / length) / math.log(
+                    length / prev_length
+                )
+            growth = (cost / prev_cost) ** exponent
+            # 预估只用于提前拦住失控的增长，是否超出预算以实测为准
+            if cost * growth > REGEX_TIME_BUDGET * _PROJECTION_MARGIN:
+                return "匹配耗时增长过快，可能导致灾难性回溯"
+        prev_length, prev_cost = length, cost
+    return None
+
+
+class GroupRuleSet:
+    """单个群的违禁词规则：违禁词、正则、禁言时长及编译好的匹配器"""
+
+    __slots__ = (
+        "words",
+        "patterns",
+        "ban_time",
+        "matcher",
+        "literal_matcher",
+        "regex",
+        "strikes",
+        "version",
+    )
+
+    def __init__(
+        self,
+        words: list[str] | None = None,
+        patterns: list[str] | None = None,
+        ban_time: int | None = None,
+    ):
+        self.words: list[str] = words or []
+        self.patterns: list[str] = patterns or []
+        # None 表示沿用全局禁言时长
+        self.ban_time: int | None = ban_time
+        self.matcher: AhoCorasick | None = None
+        # 含分隔符的违禁词单独编译，匹配时保留文本中的分隔符
+        self.literal_matcher: AhoCorasick | None = None
+        # 所有正则合并成的单个匹配器，无正则时为 None
+        self.regex: regex.Pattern | None = None
+        # 正则扫描超出耗时预算的次数
+        self.strikes: int = 0
+        # 编译自动机时的全局违禁词版本，版本落后则需重新编译
+        self.version: int = -1
+
+    def compile_regex(self):
+        """把所有正则合并为一个带命名分组的匹配器，单次扫描即可得知命中的规则"""
+        self.strikes = 0
+        if not self.patterns:
+            self.regex = None
+            return
+        self.regex = regex.compile(
+            "|".join(f"(?P<_r{i}>{p})" for i, p in enumerate(self.patterns)),
+            regex.IGNORECASE,
+        )
+
+
+class ForbiddenWordsManager:
+    """
+    按群管理违禁词规则。
+    全局违禁词（插件配置）对所有启用检测的群生效，各群还可追加自己的违禁词和正则；
+    群规则按群号存放在哈希表中，修改某个群的规则只会重新编译该群的匹配器。
+    normalize 会去掉分隔符，含分隔符的违禁词（如 +v、c++）改用只折叠宽度与大小写的 fold 匹配，
+    避免被缩成单个字母而误伤正常消息。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        normalize: Callable[[str], str] | None = None,
+        fold: Callable[[str], str] | None = None,
+    ):
+        self.path = path
+        self.normalize = normalize
+        self.fold = fold
+        self.groups: dict[str, GroupRuleSet] = {}
+        self.global_words: list[str] = []
+        self.global_ban_time: int = 0
+        self.whitelist: frozenset[str] = frozenset()
+        # 上次同步的配置列表对象，配置未重新加载时是同一对象，按身份比较即可跳过
+        self._words_src: list[str] | None = None
+        self._whitelist_src: list[str] | None = None
+        self._version = 0
+        # 仅使用全局违禁词的群共享同一份规则
+        self._default = GroupRuleSet()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for group_id, rule in data.items():
+                rule_set = GroupRuleSet(
+                    words=list(rule.get("words", [])),
+                    patterns=list(rule.get("patterns", [])),
+                    ban_time=rule.get("ban_time"),
+                )
+                try:
+                    rule_set.compile_regex()
+                except regex.error as e:
+                    logger.error(f"群{group_id}的违禁正则无法编译，已忽略: {e}")
+                    rule_set.patterns = []
+                self.groups[str(group_id)] = rule_set
+        except Exception as e:
+            logger.error(f"加载违禁词数据失败: {e}")
+
+    def _save(self):
+        data = {
+            gid: {
+                "words": rule.words,
+                "patterns": rule.patterns,
+                "ban_time": rule.ban_time,
+            }
+            for gid, rule in self.groups.items()
+        }
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def sync_config(self, words: list[str], whitelist: list[str], ban_time: int):
+        """
+        同步插件配置中的全局违禁词与白名单，仅在配置变化时才使群规则失效。
+        每条消息都会调用，配置对象未变时只做身份比较，不逐项比较列表。
+        """
+        if words is not self._words_src:
+            self._words_src = words
+            if words != self.global_words:
+                self.global_words = list(words)
+                self._version += 1
+                if ignored := self.invalid_words(words):
+                    logger.warning(f"以下全局违禁词只含不可见字符，已忽略：{ignored}")
+        if whitelist is not self._whitelist_src:
+            self._whitelist_src = whitelist
+            self.whitelist = frozenset(str(g) for g in whitelist)
+        self.global_ban_time = ban_time
+
+    def _is_literal(self, word: str) -> bool:
+        """去掉分隔符会改变该词，只能按原样（折叠宽度与大小写后）匹配"""
+        return bool(
+            self.normalize and self.fold and self.normalize(word) != self.fold(word)
+        )
+
+    def invalid_words(self, words: Iterable[str]) -> list[str]:
+        """归一化后为空、无法匹配任何消息的违禁词"""
+        fold = self.fold or self.normalize
+        return [w for w in words if not (fold(w) if fold else w)]
+
+    def _compile(self, rule: GroupRuleSet) -> GroupRuleSet:
+        if rule.version != self._version or rule.matcher is None:
+            words = self.global_words + rule.words
+            rule.matcher = AhoCorasick(
+                (w for w in words if not self._is_literal(w)),
+                normalize=self.normalize,
+            )
+            literal = [w for w in words if self._is_literal(w)]
+            rule.literal_matcher = (
+                AhoCorasick(literal, normalize=self.fold) if literal else None
+            )
+            rule.version = self._version
+        return rule
+
+    def get_rule(self, group_id: str) -> GroupRuleSet | None:
+        """
+        获取某群生效的违禁词规则，未启用检测则返回 None。
+        白名单群及设置了本群违禁词或正则的群会启用检测；仅设置了禁言时长不算启用。
+        """
+        rule = self.groups.get(group_id)
+        if rule is not None and (
+            rule.words or rule.patterns or group_id in self.whitelist
+        ):
+            return self._compile(rule)
+        if group_id in self.whitelist:
+            return self._compile(self._default)
+        return None
+
+    def match(self, group_id: str, rule: GroupRuleSet, text: str) -> str | None:
+        """
+        依次用违禁词自动机与合并正则扫描消息，返回命中的违禁词或正则。
+        正则只扫描前 REGEX_SCAN_LIMIT 个字符，超过 REGEX_TIME_BUDGET 即中止并视为未命中，
+        屡次超时的群会停用正则规则。
+        """
+        if rule.matcher and (word := rule.matcher.search(text)):
+            return word
+        if rule.literal_matcher and (word := rule.literal_matcher.search(text)):
+            return word
+        if rule.regex is None:
+            return None
+        try:
+            m = rule.regex.search(text, 0, REGEX_SCAN_LIMIT, timeout=REGEX_TIME_BUDGET)
+        except TimeoutError:
+            rule.strikes += 1
+            logger.warning(
+                f"群{group_id}的违禁正则扫描超时（{REGEX_TIME_BUDGET * 1000:.0f}ms），已中止"
+                f"（{rule.strikes}/{REGEX_MAX_STRIKES}）"
+            )
+            if rule.strikes >= REGEX_MAX_STRIKES:
+                rule.regex = None
+                logger.error(f"群{group_id}的违禁正则屡次超时，已暂停使用，请检查规则")
+            return None
+        if m is None:
+            return None
+        return rule.patterns[int(m.lastgroup[2:])] if m.lastgroup else m.group()
+
+    def get_ban_time(self, rule: GroupRuleSet) -> int:
+        return self.global_ban_time if rule.ban_time is None else rule.ban_time
+
+    def add_words(self, group_id: str, words: list[str]) -> list[str]:
+        """添加本群违禁词，返回因归一化后为空而被忽略的词"""
+        ignored = self.invalid_words(words)
+        words = [w for w in words if w not in ignored]
+        if not words:
+            return ignored
+        rule = self.groups.setdefault(group_id, GroupRuleSet())
+        rule.words = list(dict.fromkeys(rule.words + words))
+        rule.matcher = None
+        self._save()
+        return ignored
+
+    def remove_words(self, group_id: str, words: list[str]):
+        rule = self.groups.get(group_id)
+        if not rule:
+            return
+        rule.words = [w for w in rule.words if w not in words]
+        rule.matcher = None
+        self._drop_if_empty(group_id)
+        self._save()
+
+    def get_words(self, group_id: str) -> list[str]:
+        rule = self.groups.get(group_id)
+        return rule.words if rule else []
+
+    async def add_pattern(self, group_id: str, pattern: str) -> str | None:
+        """添加正则违禁规则，校验不通过时返回原因；耗时试探在线程中进行，不阻塞事件循环"""
+        if reason := await asyncio.to_thread(check_pattern, pattern):
+            return reason
+        rule = self.groups.setdefault(group_id, GroupRuleSet())
+        if pattern not in rule.patterns:
+            rule.patterns.append(pattern)
+            try:
+                rule.compile_regex()
+            except regex.error as e:
+                rule.patterns.pop()
+                rule.compile_regex()
+                return f"无法与本群已有正则合并：{e}"
+            self._save()
+        return None
+
+    def remove_pattern(self, group_id: str, pattern: str) -> bool:
+        rule = self.groups.get(group_id)
+        if not rule or pattern not in rule.patterns:
+            return False
+        rule.patterns.remove(pattern)
+        rule.compile_regex()
+        self._drop_if_empty(group_id)
+        self._save()
+        return True
+
+    def get_patterns(self, group_id: str) -> list[str]:
+        rule = self.groups.get(group_id)
+        return rule.patterns if rule else []
+
+    def set_ban_time(self, group_id: str, ban_time: int):
+        rule = self.groups.setdefault(group_id, GroupRuleSet())
+        rule.ban_time = ban_time
+        self._save()
+
+    def _drop_if_empty(self, group_id: str):
+        rule = self.groups.get(group_id)
+        if rule and not (rule.words or rule.patterns or rule.ban_time is not None):
+            del self.groups[group_id]
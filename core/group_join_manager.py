@@ -1,8 +1,22 @@
 
-from typing import Dict, List
+from typing import Dict, Iterable, List, Set
+import asyncio
 import json
 import os
+import tempfile
 
+from astrbot import logger
+
+from .bloom import BloomFilter
+from .forbidden_words import AhoCorasick
+from .sqlite_store import SQLiteStore
+
+# 修改后延迟多少秒写盘，期间的多次修改合并为一次写入
+SAVE_DELAY = 2.0
+# 全局黑名单与各群黑名单存在一起，使用这个不会与群号冲突的键
+GLOBAL_BLACKLIST_KEY = "global"
+# 全局黑名单布隆过滤器的最小容量
+GLOBAL_FILTER_MIN_CAPACITY = 1024
 
 
 class GroupJoinData:
@@ -10,7 +24,11 @@ class GroupJoinData:
         self.path = path
         self.accept_keywords: Dict[str, List[str]] = {}
         self.reject_keywords: Dict[str, List[str]] = {}
-        self.reject_ids: Dict[str, List[str]] = {}
+        # 黑名单在内存中按群保存为集合，成员判断与黑名单长度无关
+        self.reject_ids: Dict[str, Set[str]] = {}
+        self._dirty = False
+        self._flush_task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
         self._load()
 
     def _load(self):
@@ -22,29 +40,238 @@ class GroupJoinData:
                 data = json.load(f)
             self.accept_keywords = data.get("accept_keywords", {})
             self.reject_keywords = data.get("reject_keywords", {})
-            self.reject_ids = data.get("reject_ids", {})
+            raw_ids: Dict[str, List[str]] = data.get("reject_ids", {})
+            self.reject_ids = {
+                gid: {str(uid) for uid in ids} for gid, ids in raw_ids.items() if ids
+            }
         except Exception as e:
             print(f"加载 group_join_data 失败: {e}")
             self._save()
+            return
+        # 旧版退群拉黑不去重，首次加载时压缩掉重复的ID并回写
+        if sum(map(len, raw_ids.values())) != sum(map(len, self.reject_ids.values())):
+            self._save()
 
-    def _save(self):
-        data = {
-            "accept_keywords": self.accept_keywords,
-            "reject_keywords": self.reject_keywords,
-            "reject_ids": self.reject_ids,
+    def _snapshot(self) -> dict:
+        """在事件循环内复制一份当前数据，供后台线程序列化"""
+        return {
+            "accept_keywords": {
+                gid: list(kws) for gid, kws in self.accept_keywords.items()
+            },
+            "reject_keywords": {
+                gid: list(kws) for gid, kws in self.reject_keywords.items()
+            },
+            "reject_ids": {
+                gid: sorted(ids) for gid, ids in self.reject_ids.items() if ids
+            },
         }
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def _write(self, data: dict):
+        """先写临时文件再原子替换，写到一半崩溃也不会留下残缺的数据文件"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=".group_join_data.", suffix=".tmp", dir=directory
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                # 黑名单可能很长，紧凑写出，不逐行缩进
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _save(self):
+        """同步写盘，仅用于加载阶段"""
+        self._dirty = False
+        self._write(self._snapshot())
+
+    def save(self):
+        """标记数据已修改，延迟合并后在后台线程写盘；没有运行中的事件循环时直接写盘"""
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._save()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(SAVE_DELAY)
+        await self.flush()
+
+    async def flush(self):
+        """立即把未写盘的修改写入文件"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = self._snapshot()
+            try:
+                await asyncio.to_thread(self._write, data)
+            except Exception as e:
+                self._dirty = True
+                logger.error(f"保存 group_join_data 失败: {e}")
+
+    def _keywords(self, kind: str) -> Dict[str, List[str]]:
+        return self.accept_keywords if kind == "accept" else self.reject_keywords
+
+    def add_keywords(self, kind: str, group_id: str, keywords: List[str]) -> List[str]:
+        """加入 accept/reject 关键词，返回实际新增的关键词"""
+        current = self._keywords(kind).setdefault(group_id, [])
+        added = [kw for kw in dict.fromkeys(keywords) if kw not in current]
+        current.extend(added)
+        if added:
+            self.save()
+        return added
+
+    def remove_keywords(self, kind: str, group_id: str, keywords: List[str]) -> List[str]:
+        """删除 accept/reject 关键词，返回实际删除的关键词"""
+        table = self._keywords(kind)
+        current = table.get(group_id)
+        if not current:
+            return []
+        removed = [kw for kw in dict.fromkeys(keywords) if kw in current]
+        for kw in removed:
+            current.remove(kw)
+        if not current:
+            del table[group_id]
+        if removed:
+            self.save()
+        return removed
+
+    def has_reject_id(self, group_id: str, user_id: str) -> bool:
+        ids = self.reject_ids.get(group_id)
+        return ids is not None and user_id in ids
+
+    def get_reject_ids(self, group_id: str) -> List[str]:
+        return sorted(self.reject_ids.get(group_id, ()))
+
+    def add_reject_ids(self, group_id: str, ids: Iterable[str]) -> bool:
+        """加入黑名单，返回是否有新增"""
+        group_ids = self.reject_ids.setdefault(group_id, set())
+        size = len(group_ids)
+        group_ids.update(ids)
+        if len(group_ids) == size:
+            return False
+        self.save()
+        return True
+
+    def remove_reject_ids(self, group_id: str, ids: Iterable[str]) -> bool:
+        """移出黑名单，返回是否有删除"""
+        group_ids = self.reject_ids.get(group_id)
+        if not group_ids:
+            return False
+        size = len(group_ids)
+        group_ids.difference_update(ids)
+        if len(group_ids) == size:
+            return False
+        if not group_ids:
+            del self.reject_ids[group_id]
+        self.save()
+        return True
+
+
+class SQLiteGroupJoinData(GroupJoinData):
+    """
+    SQLite 存储的进群审核数据。
+    关键词量小，启动时读入内存供构建匹配器；黑名单不整体加载，按 (群, 用户) 走索引查询。
+    每次修改只写入受影响的行，无需延迟写盘。
+    """
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+        super().__init__(store.path)
+
+    def _load(self):
+        keywords = self.store.load_keywords()
+        self.accept_keywords = keywords["accept"]
+        self.reject_keywords = keywords["reject"]
 
     def save(self):
-        self._save()
+        pass
+
+    async def flush(self):
+        pass
 
+    def add_keywords(self, kind: str, group_id: str, keywords: List[str]) -> List[str]:
+        added = super().add_keywords(kind, group_id, keywords)
+        self.store.add_keywords(kind, group_id, added)
+        return added
+
+    def remove_keywords(self, kind: str, group_id: str, keywords: List[str]) -> List[str]:
+        removed = super().remove_keywords(kind, group_id, keywords)
+        self.store.remove_keywords(kind, group_id, removed)
+        return removed
+
+    def has_reject_id(self, group_id: str, user_id: str) -> bool:
+        return self.store.has_reject_id(group_id, user_id)
+
+    def get_reject_ids(self, group_id: str) -> List[str]:
+        return self.store.get_reject_ids(group_id)
+
+    def add_reject_ids(self, group_id: str, ids: Iterable[str]) -> bool:
+        return self.store.add_reject_ids(group_id, ids) > 0
+
+    def remove_reject_ids(self, group_id: str, ids: Iterable[str]) -> bool:
+        return self.store.remove_reject_ids(group_id, ids) > 0
 
 
 class GroupJoinManager:
-    def __init__(self, json_path: str):
-        self.data = GroupJoinData(json_path)
+    def __init__(self, json_path: str, store: SQLiteStore | None = None):
+        """指定 store 时使用 SQLite 存储，否则使用 json_path 指向的JSON文件"""
+        self.data = SQLiteGroupJoinData(store) if store else GroupJoinData(json_path)
         self.auto_reject_without_keyword: bool = False
+        # 按群预编译的关键词匹配器，关键词已做大小写折叠，只在增删关键词时重建
+        self._accept_matchers: Dict[str, AhoCorasick] = {}
+        self._reject_matchers: Dict[str, AhoCorasick] = {}
+        for group_id in self.data.accept_keywords:
+            self._rebuild_accept_matcher(group_id)
+        for group_id in self.data.reject_keywords:
+            self._rebuild_reject_matcher(group_id)
+        # 跨群共享的全局黑名单，开启后所有群的进群申请都会检查
+        self.global_blacklist: bool = False
+        self._global_filter = BloomFilter()
+        self._rebuild_global_filter()
+
+    def _rebuild_global_filter(self):
+        """按当前全局黑名单重建布隆过滤器，容量留出一倍余量供后续增量加入"""
+        ids = self.data.get_reject_ids(GLOBAL_BLACKLIST_KEY)
+        self._global_filter = BloomFilter(
+            capacity=max(GLOBAL_FILTER_MIN_CAPACITY, 2 * len(ids))
+        )
+        for uid in ids:
+            self._global_filter.add(uid)
+
+    def in_global_blacklist(self, user_id: str) -> bool:
+        # 布隆过滤器未命中即可确定不在黑名单中，命中后再精确查询排除误判
+        return user_id in self._global_filter and self.data.has_reject_id(
+            GLOBAL_BLACKLIST_KEY, user_id
+        )
+
+    @staticmethod
+    def _compile(matchers: Dict[str, AhoCorasick], group_id: str, keywords: List[str]):
+        matcher = AhoCorasick(kw.casefold() for kw in keywords)
+        if matcher:
+            matchers[group_id] = matcher
+        else:
+            matchers.pop(group_id, None)
+
+    def _rebuild_accept_matcher(self, group_id: str):
+        self._compile(
+            self._accept_matchers, group_id, self.data.accept_keywords.get(group_id, [])
+        )
+
+    def _rebuild_reject_matcher(self, group_id: str):
+        self._compile(
+            self._reject_matchers, group_id, self.data.reject_keywords.get(group_id, [])
+        )
 
     def reject_reason(
         self, group_id: str, user_id: str, comment: str | None = None
@@ -56,28 +283,23 @@ class GroupJoinManager:
         None: 不拒绝
         """
         # 1. 用户ID黑名单
-        if (
-            group_id in self.data.reject_ids
-            and user_id in self.data.reject_ids[group_id]
-        ):
+        if self.data.has_reject_id(group_id, user_id):
             return "黑名单用户"
+        if self.global_blacklist and self.in_global_blacklist(user_id):
+            return "全局黑名单用户"
 
         if comment:
-            lower_comment = comment.lower()
+            folded = comment.casefold()
             # 2. 黑名单关键词
-            if group_id in self.data.reject_keywords and any(
-                rk.lower() in lower_comment for rk in self.data.reject_keywords[group_id]
-            ):
+            reject_matcher = self._reject_matchers.get(group_id)
+            if reject_matcher and reject_matcher.search(folded):
                 return "命中黑名单关键词"
             # 3. 未包含任何自动同意关键词（需开启开关 & 已设置白名单关键词）
+            accept_matcher = self._accept_matchers.get(group_id)
             if (
                 self.auto_reject_without_keyword
-                and group_id in self.data.accept_keywords
-                and self.data.accept_keywords[group_id]
-                and not any(
-                    ak.lower() in lower_comment
-                    for ak in self.data.accept_keywords[group_id]
-                )
+                and accept_matcher
+                and not accept_matcher.search(folded)
             ):
                 return "未包含进群关键词"
         return None
@@ -88,62 +310,62 @@ class GroupJoinManager:
         return self.reject_reason(group_id, user_id, comment) is not None
 
     def should_approve(self, group_id: str, comment: str) -> bool:
-        if group_id not in self.data.accept_keywords:
+        matcher = self._accept_matchers.get(group_id)
+        if not matcher:
             return False
-        return any(
-            kw.lower() in comment.lower() for kw in self.data.accept_keywords[group_id]
-        )
+        return matcher.search(comment.casefold()) is not None
 
     def add_keyword(self, group_id: str, keywords: List[str]):
-        self.data.accept_keywords.setdefault(group_id, []).extend(keywords)
-        self.data.accept_keywords[group_id] = list(
-            set(self.data.accept_keywords[group_id])
-        )
-        self.data.save()
+        if self.data.add_keywords("accept", group_id, keywords):
+            self._rebuild_accept_matcher(group_id)
 
     def remove_keyword(self, group_id: str, keywords: List[str]):
-        if group_id in self.data.accept_keywords:
-            for k in keywords:
-                if k in self.data.accept_keywords[group_id]:
-                    self.data.accept_keywords[group_id].remove(k)
-            self.data.save()
+        if self.data.remove_keywords("accept", group_id, keywords):
+            self._rebuild_accept_matcher(group_id)
 
     def get_keywords(self, group_id: str) -> List[str]:
         return self.data.accept_keywords.get(group_id, [])
 
     def add_reject_keyword(self, group_id: str, keywords: List[str]):
-        self.data.reject_keywords.setdefault(group_id, []).extend(keywords)
-        self.data.reject_keywords[group_id] = list(
-            set(self.data.reject_keywords[group_id])
-        )
-        self.data.save()
+        if self.data.add_keywords("reject", group_id, keywords):
+            self._rebuild_reject_matcher(group_id)
 
     def remove_reject_keyword(self, group_id: str, keywords: List[str]):
-        if group_id in self.data.reject_keywords:
-            for k in keywords:
-                if k in self.data.reject_keywords[group_id]:
-                    self.data.reject_keywords[group_id].remove(k)
-            self.data.save()
+        if self.data.remove_keywords("reject", group_id, keywords):
+            self._rebuild_reject_matcher(group_id)
 
     def get_reject_keywords(self, group_id: str) -> List[str]:
         return self.data.reject_keywords.get(group_id, [])
 
     def add_reject_id(self, group_id: str, ids: List[str]):
-        self.data.reject_ids.setdefault(group_id, []).extend(ids)
-        self.data.reject_ids[group_id] = list(set(self.data.reject_ids[group_id]))
-        self.data.save()
+        self.data.add_reject_ids(group_id, ids)
 
     def remove_reject_id(self, group_id: str, ids: List[str]):
-        if group_id in self.data.reject_ids:
-            for uid in ids:
-                if uid in self.data.reject_ids[group_id]:
-                    self.data.reject_ids[group_id].remove(uid)
-            self.data.save()
+        self.data.remove_reject_ids(group_id, ids)
 
     def get_reject_ids(self, group_id: str) -> List[str]:
-        return self.data.reject_ids.get(group_id, [])
+        return self.data.get_reject_ids(group_id)
+
+    def add_global_reject_ids(self, ids: List[str]):
+        if not self.data.add_reject_ids(GLOBAL_BLACKLIST_KEY, ids):
+            return
+        if self._global_filter.count + len(ids) > self._global_filter.capacity:
+            self._rebuild_global_filter()
+        else:
+            for uid in ids:
+                self._global_filter.add(uid)
+
+    def remove_global_reject_ids(self, ids: List[str]):
+        # 布隆过滤器不支持删除，残留的位只会造成多一次精确查询，在下次扩容重建时清除
+        self.data.remove_reject_ids(GLOBAL_BLACKLIST_KEY, ids)
+
+    def get_global_reject_ids(self) -> List[str]:
+        return self.data.get_reject_ids(GLOBAL_BLACKLIST_KEY)
+
+    async def flush(self):
+        await self.data.flush()
 
     def blacklist_on_leave(self, group_id: str, user_id: str) -> None:
-        self.data.reject_ids.setdefault(group_id, []).append(user_id)
-        self.data.save()
+        # 已在黑名单中的反复进退群不会再写盘
+        self.data.add_reject_ids(group_id, [user_id])
 
@@ -0,0 +1,160 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+
+from aiocqhttp import CQHttp
+from astrbot import logger
+
+from .cache import TTLCache
+
+
+class JoinRequest:
+    """一条待处理的进群申请"""
+
+    __slots__ = ("client", "group_id", "user_id", "comment", "flag", "nickname")
+
+    def __init__(
+        self, client: CQHttp, group_id: str, user_id: str, comment: str | None, flag: str
+    ):
+        self.client = client
+        self.group_id = group_id
+        self.user_id = user_id
+        self.comment = comment
+        self.flag = flag
+        self.nickname = "未知昵称"
+
+
+class PendingJoinRequests:
+    """
+    等待管理员审核的进群申请索引。
+    按 (群号, QQ号) 以及通知消息ID两种方式索引，批准/驳回时直接查表，无需解析通知文本。
+    超过 ttl 未处理的申请自动过期。
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 5000):
+        self._requests: TTLCache[tuple[str, str], JoinRequest] = TTLCache(
+            maxsize=maxsize, ttl=ttl
+        )
+        self._messages: TTLCache[str, tuple[str, str]] = TTLCache(
+            maxsize=maxsize * 4, ttl=ttl
+        )
+
+    def add(self, request: JoinRequest):
+        self._requests.set((request.group_id, request.user_id), request)
+
+    def bind_message(self, message_id: str | int, request: JoinRequest):
+        """记录申请对应的通知消息ID（群通知或发给各管理员的私聊）"""
+        self._messages.set(str(message_id), (request.group_id, request.user_id))
+
+    def get(self, group_id: str, user_id: str) -> JoinRequest | None:
+        return self._requests.get((group_id, user_id))
+
+    def get_by_message(self, message_id: str | int) -> JoinRequest | None:
+        key = self._messages.get(str(message_id))
+        return self._requests.get(key) if key else None
+
+    def pending(self, group_id: str) -> list[JoinRequest]:
+        """某个群所有未过期的申请"""
+        return [
+            request
+            for key in self._requests.keys()
+            if key[0] == group_id and (request := self._requests.get(key))
+        ]
+
+    def discard(self, request: JoinRequest):
+        """申请已处理，从索引中移除；通知消息ID的映射随之失效，到期自动清理"""
+        self._requests.pop((request.group_id, request.user_id))
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+
+class JoinRequestQueue:
+    """
+    进群申请处理队列。
+    申请按群排队，由固定数量的工作协程处理；同一时刻每个群只处理一条申请，
+    处理完后该群排到就绪队列末尾，避免单个群的申请潮占满所有工作协程。
+    每条申请单独处理，一条失败不影响其他申请。
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[JoinRequest], Awaitable[None]],
+        concurrency: int = 3,
+        max_pending: int = 500,
+    ):
+        self._handler = handler
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max(1, max_pending)
+        self._groups: dict[str, deque[JoinRequest]] = {}
+        # 有申请等待处理、且当前没有工作协程在处理的群
+        self._ready: asyncio.Queue[str] = asyncio.Queue()
+        # 已在就绪队列中或正在处理的群
+        self._scheduled: set[str] = set()
+        self._workers: list[asyncio.Task] = []
+
+    def _start_workers(self):
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker_loop()))
+
+    def put(self, request: JoinRequest) -> bool:
+        """加入队列，该群积压已满时返回 False（申请留给管理员手动处理）"""
+        pending = self._groups.setdefault(request.group_id, deque())
+        if len(pending) >= self.max_pending:
+            logger.warning(
+                f"群 {request.group_id} 的进群申请积压已满，"
+                f"{request.user_id} 的申请留待手动处理"
+            )
+            return False
+        pending.append(request)
+        if request.group_id not in self._scheduled:
+            self._scheduled.add(request.group_id)
+            self._ready.put_nowait(request.group_id)
+        self._start_workers()
+        return True
+
+    async def _worker_loop(self):
+        while True:
+            group_id = await self._ready.get()
+            pending = self._groups.get(group_id)
+            try:
+                if pending:
+                    request = pending.popleft()
+                    try:
+                        await self._handler(request)
+                    except Exception as e:
+                        logger.error(
+                            f"处理群 {group_id} 中 {request.user_id} 的进群申请失败: {e}",
+                            exc_info=True,
+                        )
+            finally:
+                self._ready.task_done()
+                if pending:
+                    # 还有积压则排到队尾，让其他群也能轮到
+                    self._ready.put_nowait(group_id)
+                else:
+                    self._scheduled.discard(group_id)
+                    self._groups.pop(group_id, None)
+
+    def depth(self, group_id: str | None = None) -> int:
+        """等待处理的申请数（不含正在处理的），不指定群则为所有群的总数"""
+        if group_id is not None:
+            return len(self._groups.get(group_id, ()))
+        return sum(map(len, self._groups.values()))
+
+    def depths(self) -> dict[str, int]:
+        """各群等待处理的申请数"""
+        return {gid: len(q) for gid, q in self._groups.items() if q}
+
+    def __len__(self) -> int:
+        return self.depth()
+
+    async def stop(self):
+        """停止所有工作协程，未处理的申请保持待审核状态"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if remaining := self.depth():
+            logger.warning(f"插件停止时仍有 {remaining} 条进群申请未自动处理")
@@ -0,0 +1,71 @@
+from functools import lru_cache
+import string
+
+# 零宽字符、软连字符等不可见字符
+_INVISIBLE_CHARS = (
+    "\u00ad\u034f\u061c\u115f\u1160\u17b4\u17b5\u180e"
+    + "".join(chr(c) for c in range(0x200B, 0x2010))
+    + "".join(chr(c) for c in range(0x202A, 0x202F))
+    + "".join(chr(c) for c in range(0x2060, 0x2070))
+    + "\u3164\ufeff\uffa0"
+    + "".join(chr(c) for c in range(0xFE00, 0xFE10))  # 变体选择符
+)
+
+# 常被用来把违禁词“隔开”的分隔符：空白、ASCII/中文标点及常见符号
+_SEPARATOR_CHARS = (
+    string.whitespace
+    + string.punctuation
+    + " ·•‧∙⋅・･"
+    + "".join(chr(c) for c in range(0x2000, 0x200B))  # 各种宽度的空格
+    + "".join(chr(c) for c in range(0x2010, 0x2028))  # 破折号、引号、省略号等
+    + "".join(chr(c) for c in range(0x2030, 0x205F))
+    + "".join(chr(c) for c in range(0x3000, 0x3004))  # 全角空格、顿号、句号
+    + "".join(chr(c) for c in range(0x3008, 0x3021))  # 各种括号
+    + "\u3030\u303d\ufe30\ufe31\ufe32\ufe33\ufe34"
+    + "".join(chr(c) for c in range(0xFE50, 0xFE6C))  # 小号标点
+)
+
+
+def _build_table(strip_separators: bool) -> dict[int, int | None]:
+    table: dict[int, int | None] = {}
+    # 全角 ASCII（！~～）折叠为半角
+    for code in range(0xFF01, 0xFF5F):
+        table[code] = code - 0xFEE0
+    for ch in _INVISIBLE_CHARS:
+        table[ord(ch)] = None
+    if strip_separators:
+        # 全角标点折叠后本身就是分隔符，直接删除
+        for ch in _SEPARATOR_CHARS:
+            table[ord(ch)] = None
+        for code, target in list(table.items()):
+            if target is not None and chr(target) in _SEPARATOR_CHARS:
+                table[code] = None
+    return table
+
+
+_FOLD_TABLE = _build_table(strip_separators=True)
+# 只折叠宽度与不可见字符、保留分隔符，用于本身含分隔符的违禁词（如 +v、c++）
+_LITERAL_FOLD_TABLE = _build_table(strip_separators=False)
+
+# 超长文本很少重复出现，不进入缓存以免占用内存
+_CACHE_TEXT_LEN = 512
+
+
+@lru_cache(maxsize=4096)
+def _normalize_cached(text: str) -> str:
+    return text.translate(_FOLD_TABLE).casefold()
+
+
+def normalize_text(text: str) -> str:
+    """
+    归一化文本：全角转半角、大小写折叠、去除不可见字符和分隔符。
+    重复出现的文本（如复制粘贴的刷屏内容）只会归一化一次。
+    """
+    if len(text) > _CACHE_TEXT_LEN:
+        return text.translate(_FOLD_TABLE).casefold()
+    return _normalize_cached(text)
+
+
+def fold_text(text: str) -> str:
+    """只做全角转半角、大小写折叠、去除不可见字符，保留分隔符"""
+    return text.translate(_LITERAL_FOLD_TABLE).casefold()
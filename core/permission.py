@@ -1,4 +1,5 @@
 
+import asyncio
 from functools import wraps
 import inspect
 from typing import Awaitable, Callable, Any, AsyncGenerator, Dict, List, Optional, Union, cast
@@ -7,7 +8,12 @@ from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import (
     AiocqhttpMessageEvent,
 )
 from astrbot import logger
-from .utils import get_ats
+from .cache import TTLCache
+from .utils import get_ats, get_member_info
+
+
+# perm_block 中同时进行的权限查询数上限
+PERM_LOOKUP_CONCURRENCY = 5
 
 
 class PermLevel(IntEnum):
@@ -61,6 +67,7 @@ class PermissionManager:
         superusers: Optional[List[str]] = None,
         perms: Optional[Dict[str, str]] = None,
         level_threshold: int = 10,
+        cache_ttl: float = 300,
     ):
         if self._initialized:
             return
@@ -71,6 +78,10 @@ class PermissionManager:
             k: PermLevel.from_str(v) for k, v in perms.items()
         }
         self.level_threshold = level_threshold
+        # (群号, QQ号) -> (群角色, 群等级)，由群管理变动、进退群事件失效
+        self._member_cache: TTLCache[tuple[str, str], tuple[str, int]] = TTLCache(
+            maxsize=20000, ttl=cache_ttl
+        )
         self._initialized = True
 
     @classmethod
@@ -79,15 +90,26 @@ class PermissionManager:
         superusers: Optional[List[str]] = None,
         perms: Optional[Dict[str, str]] = None,
         level_threshold: int = 50,
+        cache_ttl: float = 300,
     ) -> "PermissionManager":
         if cls._instance is None:
             cls._instance = cls(
                 superusers=superusers,
                 perms=perms,
                 level_threshold=level_threshold,
+                cache_ttl=cache_ttl,
             )
         return cls._instance
 
+    def invalidate(self, group_id: str | int, user_id: str | int | None = None):
+        """使群成员的权限缓存失效，不指定 user_id 则使整个群失效"""
+        group_id = str(group_id)
+        if user_id is not None:
+            self._member_cache.pop((group_id, str(user_id)))
+            return
+        for key in [k for k in self._member_cache.keys() if k[0] == group_id]:
+            self._member_cache.pop(key)
+
     async def get_perm_level(
         self, event: AiocqhttpMessageEvent, user_id: str | int
     ) -> PermLevel:
@@ -96,14 +118,18 @@ class PermissionManager:
             return PermLevel.UNKNOWN
         if str(user_id) in self.superusers:
             return PermLevel.SUPERUSER
-        try:
-            info = await event.bot.get_group_member_info(
-                group_id=int(group_id), user_id=int(user_id), no_cache=True
-            )
-        except Exception:
-            return PermLevel.UNKNOWN
-        role = info.get("role", "unknown")
-        level = int(info.get("level", 0))
+        key = (str(group_id), str(user_id))
+        cached = self._member_cache.get(key)
+        if cached is None:
+            try:
+                info = await get_member_info(
+                    event.bot, group_id, user_id, no_cache=True
+                )
+            except Exception:
+                return PermLevel.UNKNOWN
+            cached = (info.get("role", "unknown"), int(info.get("level", 0)))
+            self._member_cache.set(key, cached)
+        role, level = cached
         match role:
             case "owner":
                 return PermLevel.OWNER
@@ -125,26 +151,43 @@ class PermissionManager:
         perm_key: str,
         check_at: bool = True,
     ) -> str | None:
-        user_level = await self.get_perm_level(event, user_id=event.get_sender_id())
-
         required_level = self.perms.get(perm_key)
         if required_level is None:
             return None
 
-        if user_level > required_level:
-            return f"你没{required_level}权限"
+        # 发送者、bot、被at者的权限并发查询，限制同时进行的请求数
+        sem = asyncio.Semaphore(PERM_LOOKUP_CONCURRENCY)
 
-        bot_level = await self.get_perm_level(event, user_id=event.get_self_id())
-        if bot_level > bot_perm:
-            return f"我没{bot_perm}权限"
+        async def lookup(user_id: str) -> PermLevel:
+            async with sem:
+                return await self.get_perm_level(event, user_id=user_id)
 
-        if check_at:
-            for at_id in get_ats(event):
-                at_level = await self.get_perm_level(event, user_id=at_id)
+        user_task = asyncio.create_task(lookup(event.get_sender_id()))
+        bot_task = asyncio.create_task(lookup(event.get_self_id()))
+        at_tasks = [
+            asyncio.create_task(lookup(at_id))
+            for at_id in (get_ats(event) if check_at else [])
+        ]
+        try:
+            user_level = await user_task
+            if user_level > required_level:
+                return f"你没{required_level}权限"
+
+            bot_level = await bot_task
+            if bot_level > bot_perm:
+                return f"我没{bot_perm}权限"
+
+            for at_task in at_tasks:
+                at_level = await at_task
                 if bot_level >= at_level:
                     return f"我动不了{at_level}"
 
-        return None
+            return None
+        finally:
+            # 提前返回时取消尚未完成的查询
+            for task in (bot_task, *at_tasks):
+                if not task.done():
+                    task.cancel()
 
 
 def perm_required(
@@ -0,0 +1,194 @@
+import json
+import os
+import sqlite3
+from typing import Iterable
+
+from astrbot import logger
+
+# 主键即索引：按群查关键词、按 (群, 用户) 判断黑名单、按群读写宵禁都走索引
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS join_keywords (
+    group_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    PRIMARY KEY (group_id, kind, keyword)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS reject_ids (
+    group_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (group_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS curfew_tasks (
+    group_id TEXT PRIMARY KEY,
+    schedule TEXT NOT NULL,
+    whole_ban INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+# 关键词类别
+KEYWORD_KINDS = ("accept", "reject")
+
+
+class SQLiteStore:
+    """
+    插件数据的 SQLite 存储（WAL 模式）。
+    每次修改只写受影响的行，查询走主键索引，启动时无需解析整个数据文件。
+    连接只在事件循环线程中使用，单行读写耗时很短，直接同步执行。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    # ---------- 进群关键词 ----------
+
+    def load_keywords(self) -> dict[str, dict[str, list[str]]]:
+        """读取全部关键词：{类别: {群号: [关键词]}}"""
+        result: dict[str, dict[str, list[str]]] = {kind: {} for kind in KEYWORD_KINDS}
+        for group_id, kind, keyword in self._conn.execute(
+            "SELECT group_id, kind, keyword FROM join_keywords"
+        ):
+            result.setdefault(kind, {}).setdefault(group_id, []).append(keyword)
+        return result
+
+    def add_keywords(self, kind: str, group_id: str, keywords: Iterable[str]):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO join_keywords VALUES (?, ?, ?)",
+                ((group_id, kind, kw) for kw in keywords),
+            )
+
+    def remove_keywords(self, kind: str, group_id: str, keywords: Iterable[str]):
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM join_keywords WHERE group_id = ? AND kind = ? AND keyword = ?",
+                ((group_id, kind, kw) for kw in keywords),
+            )
+
+    # ---------- 进群黑名单 ----------
+
+    def has_reject_id(self, group_id: str, user_id: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM reject_ids WHERE group_id = ? AND user_id = ?",
+            (group_id, user_id),
+        ).fetchone()
+        return row is not None
+
+    def get_reject_ids(self, group_id: str) -> list[str]:
+        return [
+            uid
+            for (uid,) in self._conn.execute(
+                "SELECT user_id FROM reject_ids WHERE group_id = ? ORDER BY user_id",
+                (group_id,),
+            )
+        ]
+
+    def add_reject_ids(self, group_id: str, ids: Iterable[str]) -> int:
+        """加入黑名单，返回实际新增的条数"""
+        with self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO reject_ids VALUES (?, ?)",
+                ((group_id, uid) for uid in ids),
+            )
+            return self._conn.total_changes - before
+
+    def remove_reject_ids(self, group_id: str, ids: Iterable[str]) -> int:
+        """移出黑名单，返回实际删除的条数"""
+        with self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "DELETE FROM reject_ids WHERE group_id = ? AND user_id = ?",
+                ((group_id, uid) for uid in ids),
+            )
+            return self._conn.total_changes - before
+
+    # ---------- 宵禁 ----------
+
+    def load_curfews(self) -> dict[str, dict]:
+        """读取全部宵禁任务，格式与 curfew_tasks.json 相同"""
+        return {
+            group_id: {**json.loads(schedule), "whole_ban": bool(whole_ban)}
+            for group_id, schedule, whole_ban in self._conn.execute(
+                "SELECT group_id, schedule, whole_ban FROM curfew_tasks"
+            )
+        }
+
+    def save_curfews(self, entries: dict[str, dict | None]):
+        """按群写入宵禁任务，值为 None 表示删除该群的任务"""
+        with self._conn:
+            for group_id, entry in entries.items():
+                if entry is None:
+                    self._conn.execute(
+                        "DELETE FROM curfew_tasks WHERE group_id = ?", (group_id,)
+                    )
+                    continue
+                entry = dict(entry)
+                whole_ban = bool(entry.pop("whole_ban", False))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO curfew_tasks VALUES (?, ?, ?)",
+                    (group_id, json.dumps(entry, ensure_ascii=False), int(whole_ban)),
+                )
+
+    # ---------- 迁移 ----------
+
+    def migrate_json(self, join_data_path: str, curfew_data_path: str):
+        """
+        首次启用时导入现有的 JSON 数据文件，原文件保留不动。
+        导入在同一个事务中完成，任一文件导入失败则整体回滚，下次启动重试。
+        """
+        if self._conn.execute(
+            "SELECT 1 FROM meta WHERE key = 'json_migrated'"
+        ).fetchone():
+            return
+        try:
+            with self._conn:
+                self._import_join_data(join_data_path)
+                self._import_curfews(curfew_data_path)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('json_migrated', '1')"
+                )
+        except Exception as e:
+            logger.error(f"导入JSON数据失败，已回滚，下次启动时重试: {e}", exc_info=True)
+            return
+        logger.info("JSON数据已导入 SQLite")
+
+    def _import_join_data(self, path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for kind in KEYWORD_KINDS:
+            for group_id, keywords in data.get(f"{kind}_keywords", {}).items():
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO join_keywords VALUES (?, ?, ?)",
+                    ((group_id, kind, kw) for kw in keywords),
+                )
+        for group_id, ids in data.get("reject_ids", {}).items():
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO reject_ids VALUES (?, ?)",
+                ((group_id, str(uid)) for uid in ids),
+            )
+
+    def _import_curfews(self, path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            data: dict[str, dict] = json.load(f)
+        for group_id, entry in data.items():
+            entry = dict(entry)
+            whole_ban = bool(entry.pop("whole_ban", False))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO curfew_tasks VALUES (?, ?, ?)",
+                (group_id, json.dumps(entry, ensure_ascii=False), int(whole_ban)),
+            )
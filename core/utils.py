@@ -1,7 +1,10 @@
+import asyncio
 from datetime import datetime
 import os
-from typing import Tuple
+import time
+from typing import AsyncIterator, Tuple
 
+from aiocqhttp import CQHttp
 from aiohttp import ClientSession
 from astrbot.core.message.components import At, BaseMessageComponent, Image, Reply
 from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import (
@@ -9,6 +12,8 @@ from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import (
 )
 from astrbot import logger
 
+from .cache import TTLCache
+
 BAN_ME_QUOTES: list[str] = [
     "还真有人有这种奇怪的要求",
     "满足你",
@@ -43,7 +48,14 @@ ADMIN_HELP = (
     "- 设置群名 <新群名> - 修改群名称\n"
     "- 发布群公告 <内容> - 发布群公告，可引用图片\n"
     "- 查看群公告 - 查看群公告\n"
-    "- 开启宵禁 <HH:MM> <HH:MM> - 开启宵禁任务，需输入开始时间、结束时间\n"
+    "- 添加违禁词 <违禁词> - 添加本群违禁词，多个违禁词用空格分隔\n"
+    "- 删除违禁词 <违禁词> - 删除本群违禁词，多个违禁词用空格分隔\n"
+    "- 查看违禁词 - 查看本群违禁词及违禁正则\n"
+    "- 添加违禁正则 <正则> - 添加本群违禁正则，整条内容作为一个正则\n"
+    "- 删除违禁正则 <正则> - 删除本群违禁正则\n"
+    "- 违禁词禁言 <时长(秒)> - 设置本群触发违禁词的禁言时长\n"
+    "- 开启宵禁 [星期] <HH:MM> <HH:MM> ... - 开启宵禁任务，可输入多组开始、结束时间，"
+    "星期可写每天/工作日/周末/周一至周五等，作用于其后的时间\n"
     "- 关闭宵禁 - 关闭当前群的宵禁任务\n"
     "- 添加进群关键词 <关键词> - 添加自动批准进群的关键词，多个关键词用空格分隔\n"
     "- 删除进群关键词 <关键词> - 删除自动批准进群的关键词，多个关键词用空格分隔\n"
@@ -51,8 +63,12 @@ ADMIN_HELP = (
     "- 添加进群黑名单 <QQ号> - 添加进群黑名单，多个QQ号用空格分隔\n"
     "- 删除进群黑名单 <QQ号> - 从进群黑名单中删除指定QQ号\n"
     "- 查看进群黑名单 - 查看当前群的进群黑名单\n"
-    "- 同意进群 - 同意引用的进群申请\n"
-    "- 拒绝进群 <理由> - 拒绝引用的进群申请，可附带拒绝理由\n"
+    "- 添加全局黑名单 <QQ号> - 添加全局进群黑名单，对所有群生效（需在配置中启用）\n"
+    "- 删除全局黑名单 <QQ号> - 从全局进群黑名单中删除指定QQ号\n"
+    "- 查看全局黑名单 - 查看全局进群黑名单\n"
+    "- 查看进群队列 - 查看等待自动审核的进群申请数\n"
+    "- 同意进群 [@用户/QQ号/全部] - 同意引用的进群申请，或同意指定用户/本群全部待审核的申请\n"
+    "- 拒绝进群 [@用户/QQ号/全部] <理由> - 拒绝引用的或指定的进群申请，可附带拒绝理由\n"
     "- 群友信息 - 查看群成员信息\n"
     "- 清理群友 <未发言天数> <群等级> - 清理群友，可指定未发言天数和群等级\n"
     "- 群管帮助 - 显示本插件的帮助信息"
@@ -77,13 +93,136 @@ def print_logo():
     print("\033[94m欢迎使用群管插件！\033[0m")  # 蓝色文字
 
 
+# 正在进行中的群成员信息请求，(bot, 群号, QQ号) -> Future
+_member_info_inflight: dict[tuple[int, int, int], asyncio.Future] = {}
+
+
+async def get_member_info(
+    client: CQHttp, group_id: str | int, user_id: str | int, no_cache: bool = False
+) -> dict:
+    """获取群成员信息，同一成员的并发请求合并为一次协议端调用"""
+    key = (id(client), int(group_id), int(user_id))
+    future = _member_info_inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(
+            client.get_group_member_info(
+                group_id=int(group_id), user_id=int(user_id), no_cache=no_cache
+            )
+        )
+        _member_info_inflight[key] = future
+
+        def _done(f: asyncio.Future):
+            _member_info_inflight.pop(key, None)
+            # 所有等待者都已取消时，避免出现未读取异常的警告
+            if not f.cancelled():
+                f.exception()
+
+        future.add_done_callback(_done)
+    # 单个调用方被取消不应影响其他共享该请求的调用方
+    return await asyncio.shield(future)
+
+
+# 翻页拉取群消息历史时每页的条数与最多翻页数
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_BUDGET = 20
+
+
+def _history_seq(message: dict) -> int:
+    return int(message.get("message_seq") or message.get("message_id") or 0)
+
+
+async def iter_group_history(
+    client: CQHttp,
+    group_id: str | int,
+    page_size: int = HISTORY_PAGE_SIZE,
+    max_pages: int = HISTORY_PAGE_BUDGET,
+) -> AsyncIterator[list[dict]]:
+    """
+    从最新消息开始，以每页最旧一条的 message_seq 为锚点向前翻页，逐页产出群消息（页内从新到旧）。
+    翻到头、某页没有新消息或达到翻页上限时结束。
+    """
+    seq = 0
+    seen: set = set()
+    for _ in range(max_pages):
+        result = await client.api.call_action(
+            "get_group_msg_history",
+            group_id=int(group_id),
+            message_seq=seq,
+            count=page_size,
+            reverseOrder=True,
+        )
+        # 锚点消息本身会再次出现在下一页中，按消息ID去重
+        messages = [
+            msg
+            for msg in (result or {}).get("messages", [])
+            if msg.get("message_id") not in seen
+        ]
+        if not messages:
+            return
+        messages.sort(key=_history_seq, reverse=True)
+        seen.update(msg.get("message_id") for msg in messages)
+        yield messages
+        oldest = _history_seq(messages[-1])
+        if not oldest or oldest == seq:
+            return
+        seq = oldest
+
+
+class NicknameCache:
+    """
+    QQ号 → 昵称 的缓存，进群申请、退群、踢人共用。
+    查询失败或未取到昵称时返回“未知昵称”，失败结果不缓存。
+    """
+
+    def __init__(self, ttl: float = 600, maxsize: int = 5000):
+        self._cache: TTLCache[str, str] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def put(self, user_id: str | int, nickname: str | None):
+        if nickname:
+            self._cache.set(str(user_id), nickname)
+
+    async def get(self, client: CQHttp, user_id: str | int) -> str:
+        nickname = self._cache.get(str(user_id))
+        if nickname:
+            return nickname
+        try:
+            info = await client.get_stranger_info(user_id=int(user_id))
+            nickname = info.get("nickname")
+        except Exception as e:
+            logger.warning(f"获取 {user_id} 的昵称失败: {e}")
+            return "未知昵称"
+        self.put(user_id, nickname)
+        return nickname or "未知昵称"
+
+
+class RateLimiter:
+    """令牌桶限速器，限制每秒调用协议端接口的次数"""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = max(float(rate), 0.001)
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """取得一个令牌，令牌不足时等待"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
 async def get_nickname(event: AiocqhttpMessageEvent, user_id) -> str:
     """获取指定群友的群昵称或Q名"""
-    client = event.bot
-    group_id = event.get_group_id()
-    all_info = await client.get_group_member_info(
-        group_id=int(group_id), user_id=int(user_id)
-    )
+    all_info = await get_member_info(event.bot, event.get_group_id(), user_id)
     return all_info.get("card") or all_info.get("nickname")
 
 
@@ -103,6 +242,13 @@ def get_replyer_id(event: AiocqhttpMessageEvent) -> str | None:
             return str(seg.sender_id)
 
 
+def get_reply_id(event: AiocqhttpMessageEvent) -> str | None:
+    """获取被引用消息的id"""
+    for seg in event.get_messages():
+        if isinstance(seg, Reply):
+            return str(seg.id)
+
+
 def get_reply_message_str(event: AiocqhttpMessageEvent) -> str | None:
     """
     获取被引用的消息解析后的纯文本消息字符串。
@@ -1,5 +1,4 @@
 import asyncio
-from collections import defaultdict, deque
 import os
 import random
 import textwrap
@@ -15,13 +14,22 @@ from astrbot.core.message.components import Plain
 from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import (
     AiocqhttpMessageEvent,
 )
+from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_platform_adapter import (
+    AiocqhttpAdapter,
+)
 from astrbot.core.utils.session_waiter import (
     session_waiter,
     SessionController,
 )
 from astrbot.core.star.filter.event_message_type import EventMessageType
-from .core.curfew_manager import CurfewManager
+from .core.anti_spam import DuplicateDetector, GroupFloodTracker, SpamTracker
+from .core.curfew_manager import CURFEW_DATA_PATH, CurfewManager
+from .core.curfew_schedule import CurfewSchedule
+from .core.forbidden_words import ForbiddenWordsManager
 from .core.group_join_manager import GroupJoinManager
+from .core.join_queue import JoinRequest, JoinRequestQueue, PendingJoinRequests
+from .core.sqlite_store import SQLiteStore
+from .core.normalize import fold_text, normalize_text
 from .core.permission import (
     PermLevel,
     PermissionManager,
@@ -29,6 +37,10 @@ from .core.permission import (
 )
 from .core.utils import *
 
+# 等待 aiocqhttp 平台就绪的轮询间隔（秒），每次未就绪翻倍，直到上限
+CURFEW_INIT_INTERVAL = 5
+CURFEW_INIT_MAX_INTERVAL = 300
+
 
 @register(
     "astrbot_plugin_QQAdmin",
@@ -43,14 +55,32 @@ class AdminPlugin(Star):
         self.conf = config
         self.admins_id: list[str] = context.get_config().get("admins_id", [])
 
-        self.msg_timestamps: dict[str, dict[str, deque[float]]] = defaultdict(
-            lambda: defaultdict(lambda: deque(maxlen=self.conf["spamming"]["count"]))
+        # 刷屏检测状态，闲置超过禁言时长的成员会被淘汰
+        self.spam_tracker = SpamTracker(ttl=self.conf["spamming"]["ban_time"] + 300)
+        # 重复内容检测状态
+        self.duplicate_detector = DuplicateDetector(
+            window=self.conf["duplicate"]["window"]
         )
-        self.last_banned_time: dict[str, dict[str, float]] = defaultdict(
-            lambda: defaultdict(float)
+        # 群消息速率统计及刷屏触发的全员禁言任务
+        self.flood_tracker = GroupFloodTracker(window=self.conf["flood"]["window"])
+        self._flood_ban_tasks: dict[str, asyncio.Task] = {}
+        # 宵禁管理器在 aiocqhttp 平台就绪后创建
+        self.curfew_mgr: CurfewManager | None = None
+        self._curfew_init_task: asyncio.Task | None = None
+        # 进群申请、退群、踢人通知共用的昵称缓存
+        self.nickname_cache = NicknameCache()
+        # 进群申请排队处理，自动审核调用 set_group_add_request 时限速
+        join_conf = self.conf["join_queue"]
+        self.join_queue = JoinRequestQueue(
+            self._process_join_request,
+            concurrency=join_conf["concurrency"],
+            max_pending=join_conf["max_pending"],
         )
-        # 延时初始化宵禁管理器
-        self.curfew_mgr = None
+        self._join_request_limiter = RateLimiter(join_conf["rate"])
+        # 等待管理员批准/驳回的进群申请
+        self.pending_joins = PendingJoinRequests(ttl=join_conf["pending_ttl"])
+        # storage_backend 为 sqlite 时的数据库
+        self.store: SQLiteStore | None = None
 
     async def initialize(self):
         # 初始化权限管理器
@@ -58,30 +88,78 @@ class AdminPlugin(Star):
             superusers=self.admins_id,
             perms=self.conf["perms"],
             level_threshold=self.conf["level_threshold"],
+            cache_ttl=self.conf["perm_cache_ttl"],
         )
         # 初始化进群管理器
         self.plugin_data_dir = str(StarTools.get_data_dir("astrbot_plugin_QQAdmin"))
         group_join_data = os.path.join(self.plugin_data_dir, "group_join_data.json")
-        self.group_join_manager = GroupJoinManager(group_join_data)
+        if self.conf.get("storage_backend") == "sqlite":
+            self.store = SQLiteStore(os.path.join(self.plugin_data_dir, "qqadmin.db"))
+            self.store.migrate_json(group_join_data, str(CURFEW_DATA_PATH))
+        self.group_join_manager = GroupJoinManager(group_join_data, store=self.store)
         self.group_join_manager.auto_reject_without_keyword = bool(
             self.conf.get("reject_without_keyword", False)
         )
+        self.group_join_manager.global_blacklist = bool(
+            self.conf.get("global_blacklist", False)
+        )
+        # 初始化违禁词管理器
+        forbidden_data = os.path.join(self.plugin_data_dir, "forbidden_words.json")
+        self.forbidden_mgr = ForbiddenWordsManager(
+            forbidden_data, normalize=normalize_text, fold=fold_text
+        )
+
+        # 后台等待 aiocqhttp 平台就绪后启动宵禁
+        self._curfew_init_task = asyncio.create_task(self._init_curfew_manager())
 
         # 概率打印LOGO（qwq）
         if random.random() < 0.01:
             print_logo()
 
 
-    async def _send_admin(self, client: CQHttp, message: str):
-        """向bot管理员发送私聊消息"""
+    async def _init_curfew_manager(self):
+        """等待 aiocqhttp 平台加载后创建宵禁管理器，重启后无需等待消息即可恢复宵禁"""
+        interval = CURFEW_INIT_INTERVAL
+        while not self.curfew_mgr:
+            platform = self.context.get_platform(filter.PlatformAdapterType.AIOCQHTTP)
+            if isinstance(platform, AiocqhttpAdapter):
+                self._create_curfew_manager(platform.get_client())
+                return
+            if interval == CURFEW_INIT_MAX_INTERVAL:
+                logger.warning(
+                    f"未找到aiocqhttp平台，{interval}秒后重试（收到宵禁命令时也会直接初始化）"
+                )
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, CURFEW_INIT_MAX_INTERVAL)
+
+    def _create_curfew_manager(self, client: CQHttp) -> CurfewManager:
+        """创建宵禁管理器（已创建则直接返回）"""
+        if not self.curfew_mgr:
+            curfew_conf = self.conf["curfew"]
+            self.curfew_mgr = CurfewManager(
+                client,
+                concurrency=curfew_conf["concurrency"],
+                rate=curfew_conf["rate"],
+                max_retries=curfew_conf["max_retries"],
+                store=self.store,
+            )
+            logger.info("宵禁管理器已初始化")
+        return self.curfew_mgr
+
+    async def _send_admin(self, client: CQHttp, message: str) -> list[str]:
+        """向bot管理员发送私聊消息，返回发送成功的消息ID"""
+        message_ids = []
         for admin_id in self.admins_id:
             if admin_id.isdigit():
                 try:
-                    await client.send_private_msg(
+                    result = await client.send_private_msg(
                         user_id=int(admin_id), message=message
                     )
+                    if result and result.get("message_id") is not None:
+                        message_ids.append(str(result["message_id"]))
                 except Exception as e:
                     logger.error(f"无法发送消息给bot管理员：{e}")
+        return message_ids
 
     @filter.command("禁言")
     @perm_required(PermLevel.ADMIN)
@@ -221,7 +299,10 @@ class AdminPlugin(Star):
     async def set_group_kick(self, event: AiocqhttpMessageEvent):
         """踢了@user"""
         for tid in get_ats(event):
-            target_name = await get_nickname(event, user_id=tid)
+            info = await get_member_info(event.bot, event.get_group_id(), tid)
+            target_name = info.get("card") or info.get("nickname")
+            # 昵称缓存按QQ号跨群共用，只存Q名，不存本群的群名片
+            self.nickname_cache.put(tid, info.get("nickname"))
             await event.bot.set_group_kick(
                 group_id=int(event.get_group_id()),
                 user_id=int(tid),
@@ -234,7 +315,10 @@ class AdminPlugin(Star):
     async def set_group_block(self, event: AiocqhttpMessageEvent):
         """拉黑 @user"""
         for tid in get_ats(event):
-            target_name = await get_nickname(event, user_id=tid)
+            info = await get_member_info(event.bot, event.get_group_id(), tid)
+            target_name = info.get("card") or info.get("nickname")
+            # 昵称缓存按QQ号跨群共用，只存Q名，不存本群的群名片
+            self.nickname_cache.put(tid, info.get("nickname"))
             await event.bot.set_group_kick(
                 group_id=int(event.get_group_id()),
                 user_id=int(tid),
@@ -250,6 +334,7 @@ class AdminPlugin(Star):
             await event.bot.set_group_admin(
                 group_id=int(event.get_group_id()), user_id=int(tid), enable=True
             )
+            PermissionManager.get_instance().invalidate(event.get_group_id(), tid)
             chain = [At(qq=tid), Plain(text="你已被设为管理员")]
             yield event.chain_result(chain)
 
@@ -261,6 +346,7 @@ class AdminPlugin(Star):
             await event.bot.set_group_admin(
                 group_id=int(event.get_group_id()), user_id=int(tid), enable=False
             )
+            PermissionManager.get_instance().invalidate(event.get_group_id(), tid)
             chain = [At(qq=tid), Plain(text="你的管理员身份已被取消")]
             yield event.chain_result(chain)
 
@@ -316,37 +402,33 @@ class AdminPlugin(Star):
             end_arg = event.message_str.split()[-1]
             count = int(end_arg) if end_arg.isdigit() else 10
 
-            payloads = {
-                "group_id": int(event.get_group_id()),
-                "message_seq": 0,
-                "count": count,
-                "reverseOrder": True,
-            }
-            result: dict = await client.api.call_action(
-                "get_group_msg_history", **payloads
-            )
-
-            messages = list(reversed(result.get("messages", [])))
-            delete_count = 0
             sem = asyncio.Semaphore(10)
 
             # 撤回消息
-            async def try_delete(message: dict):
-                nonlocal delete_count
-                if str(message["sender"]["user_id"]) not in target_ids:
-                    return
+            async def try_delete(message: dict) -> bool:
                 async with sem:
                     try:
                         await client.delete_msg(message_id=message["message_id"])
-                        delete_count += 1
+                        return True
                     except Exception:
-                        pass
-
-            # 并发撤回
-            tasks = [try_delete(msg) for msg in messages]
-            await asyncio.gather(*tasks)
-
-            yield event.plain_result(f"已从{count}条消息中撤回{delete_count}条")
+                        return False
+
+            # 向前翻页直到找到 count 条目标的消息或达到翻页上限，
+            # 找到的消息立即开始撤回，与后续翻页同时进行
+            tasks: list[asyncio.Task] = []
+            scanned = 0
+            async for page in iter_group_history(client, event.get_group_id()):
+                for message in page:
+                    scanned += 1
+                    if str(message.get("sender", {}).get("user_id")) in target_ids:
+                        tasks.append(asyncio.create_task(try_delete(message)))
+                        if len(tasks) >= count:
+                            break
+                if len(tasks) >= count:
+                    break
+            delete_count = sum(await asyncio.gather(*tasks))
+
+            yield event.plain_result(f"已从{scanned}条消息中撤回{delete_count}条")
 
     @filter.platform_adapter_type(filter.PlatformAdapterType.AIOCQHTTP)
     @filter.event_message_type(EventMessageType.GROUP_MESSAGE)
@@ -354,81 +436,273 @@ class AdminPlugin(Star):
         """
         自动检测违禁词，撤回并禁言
         """
-        # 群聊白名单
-        if  event.get_group_id() not in self.conf["forbidden"]["whitelist"]:
+        if not event.message_str:
             return
-        if not self.conf["forbidden"]["words"] or not event.message_str:
+        forbidden_conf = self.conf["forbidden"]
+        self.forbidden_mgr.sync_config(
+            forbidden_conf["words"],
+            forbidden_conf["whitelist"],
+            forbidden_conf["ban_time"],
+        )
+        # 群聊白名单或本群违禁词
+        rule = self.forbidden_mgr.get_rule(event.get_group_id())
+        if not rule:
             return
-        # 检测违禁词
-        for word in self.conf["forbidden"]["words"]:
-            if word in event.message_str:
-                # yield event.plain_result("不准发禁词！")
-                # 撤回消息
-                try:
-                    message_id = event.message_obj.message_id
-                    await event.bot.delete_msg(message_id=int(message_id))
-                except Exception:
-                    pass
-                # 禁言发送者
-                if self.conf["forbidden"]["ban_time"] > 0:
-                    try:
-                        await event.bot.set_group_ban(
-                            group_id=int(event.get_group_id()),
-                            user_id=int(event.get_sender_id()),
-                            duration=self.conf["forbidden"]["ban_time"],
-                        )
-                    except Exception:
-                        logger.error(f"bot在群{event.get_group_id()}权限不足，禁言失败")
-                        pass
-                break
+        # 检测违禁词（归一化后单次扫描，防止全角、零宽字符、插入符号等绕过）及违禁正则
+        word = self.forbidden_mgr.match(event.get_group_id(), rule, event.message_str)
+        if not word:
+            return
+        logger.info(f"群{event.get_group_id()}的{event.get_sender_id()}触发违禁词：{word}")
+        # yield event.plain_result("不准发禁词！")
+        # 撤回消息
+        try:
+            message_id = event.message_obj.message_id
+            await event.bot.delete_msg(message_id=int(message_id))
+        except Exception:
+            pass
+        # 禁言发送者
+        ban_time = self.forbidden_mgr.get_ban_time(rule)
+        if ban_time > 0:
+            try:
+                await event.bot.set_group_ban(
+                    group_id=int(event.get_group_id()),
+                    user_id=int(event.get_sender_id()),
+                    duration=ban_time,
+                )
+            except Exception:
+                logger.error(f"bot在群{event.get_group_id()}权限不足，禁言失败")
+                pass
+
+    @filter.command("添加违禁词")
+    @perm_required(PermLevel.ADMIN)
+    async def add_forbidden_words(self, event: AiocqhttpMessageEvent):
+        """添加本群违禁词"""
+        if words := event.message_str.removeprefix("添加违禁词").strip().split():
+            ignored = self.forbidden_mgr.add_words(event.get_group_id(), words)
+            if added := [w for w in words if w not in ignored]:
+                yield event.plain_result(f"新增本群违禁词：{added}")
+            if ignored:
+                yield event.plain_result(f"以下违禁词只含不可见字符，已忽略：{ignored}")
+        else:
+            yield event.plain_result("未输入任何违禁词")
+
+    @filter.command("删除违禁词")
+    @perm_required(PermLevel.ADMIN)
+    async def remove_forbidden_words(self, event: AiocqhttpMessageEvent):
+        """删除本群违禁词"""
+        if words := event.message_str.removeprefix("删除违禁词").strip().split():
+            self.forbidden_mgr.remove_words(event.get_group_id(), words)
+            yield event.plain_result(f"已删本群违禁词：{words}")
+        else:
+            yield event.plain_result("未指定要删除的违禁词")
+
+    @filter.command("违禁词", alias={"查看违禁词"})
+    @perm_required(PermLevel.ADMIN)
+    async def view_forbidden_words(self, event: AiocqhttpMessageEvent):
+        """查看本群违禁词"""
+        words = self.forbidden_mgr.get_words(event.get_group_id())
+        patterns = self.forbidden_mgr.get_patterns(event.get_group_id())
+        if not words and not patterns:
+            yield event.plain_result("本群没有设置违禁词")
+            return
+        reply = f"本群的违禁词：{words}"
+        if patterns:
+            reply += f"\n本群的违禁正则：{patterns}"
+        yield event.plain_result(reply)
+
+    @filter.command("添加违禁正则")
+    @perm_required(PermLevel.ADMIN)
+    async def add_forbidden_regex(self, event: AiocqhttpMessageEvent):
+        """添加本群违禁正则（整条作为一个正则）"""
+        pattern = event.message_str.removeprefix("添加违禁正则").strip()
+        if not pattern:
+            yield event.plain_result("未输入正则表达式")
+            return
+        if reason := await self.forbidden_mgr.add_pattern(
+            event.get_group_id(), pattern
+        ):
+            yield event.plain_result(f"正则未添加：{reason}")
+            return
+        yield event.plain_result(f"新增本群违禁正则：{pattern}")
+
+    @filter.command("删除违禁正则")
+    @perm_required(PermLevel.ADMIN)
+    async def remove_forbidden_regex(self, event: AiocqhttpMessageEvent):
+        """删除本群违禁正则"""
+        pattern = event.message_str.removeprefix("删除违禁正则").strip()
+        if self.forbidden_mgr.remove_pattern(event.get_group_id(), pattern):
+            yield event.plain_result(f"已删本群违禁正则：{pattern}")
+        else:
+            yield event.plain_result("本群没有这条违禁正则")
+
+    @filter.command("违禁词禁言")
+    @perm_required(PermLevel.ADMIN)
+    async def set_forbidden_ban_time(
+        self, event: AiocqhttpMessageEvent, ban_time: int | None = None
+    ):
+        """违禁词禁言 60"""
+        if ban_time is None or not isinstance(ban_time, int) or ban_time < 0:
+            yield event.plain_result("请输入禁言时长（秒），0表示不禁言")
+            return
+        self.forbidden_mgr.set_ban_time(event.get_group_id(), ban_time)
+        yield event.plain_result(f"本群违禁词禁言时长已设为{ban_time}秒")
 
     @filter.platform_adapter_type(filter.PlatformAdapterType.AIOCQHTTP)
     @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
     async def spamming_ban(self, event: AiocqhttpMessageEvent):
         """刷屏检测与禁言"""
+        spam_conf = self.conf["spamming"]
+        count = spam_conf["count"]
         group_id = event.get_group_id()
         sender_id = event.get_sender_id()
         if (
             sender_id == event.get_self_id()
-            or self.conf["spamming"]["count"] == 0
+            or count == 0
             or len(event.get_messages()) == 0
         ):
             return
-        if group_id not in self.conf["spamming"]["whitelist"]:
+        if group_id not in spam_conf["whitelist"]:
             return
         now = time.time()
+        ban_time = spam_conf["ban_time"]
 
-        last_time = self.last_banned_time[group_id][sender_id]
-        if now - last_time < self.conf["spamming"]["ban_time"]:
+        state = self.spam_tracker.get(group_id, sender_id)
+        if now - state.last_banned < ban_time:
             return
 
-        timestamps = self.msg_timestamps[group_id][sender_id]
-        timestamps.append(now)
-        count = self.conf["spamming"]["count"]
-        if len(timestamps) >= count:
-            recent = list(timestamps)[-count:]
-            intervals = [recent[i + 1] - recent[i] for i in range(count - 1)]
-            if (
-                all(
-                    interval < self.conf["spamming"]["interval"]
-                    for interval in intervals
+        if state.hit(now, spam_conf["interval"]) >= count and ban_time:
+            # 提前写入禁止标记，防止并发重复禁
+            state.last_banned = now
+
+            try:
+                await event.bot.set_group_ban(
+                    group_id=int(group_id),
+                    user_id=int(sender_id),
+                    duration=ban_time,
                 )
-                and self.conf["spamming"]["ban_time"]
-            ):
-                # 提前写入禁止标记，防止并发重复禁
-                self.last_banned_time[group_id][sender_id] = now
+                nickname = await get_nickname(event, sender_id)
+                yield event.plain_result(f"检测到{nickname}刷屏，已禁言")
+            except Exception:
+                logger.error(f"bot在群{group_id}权限不足，禁言失败")
+            state.clear()
 
+    @filter.platform_adapter_type(filter.PlatformAdapterType.AIOCQHTTP)
+    @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
+    async def duplicate_ban(self, event: AiocqhttpMessageEvent):
+        """重复内容检测：撤回重复消息并禁言发送者"""
+        dup_conf = self.conf["duplicate"]
+        sender_limit = dup_conf["count"]
+        group_limit = dup_conf["group_count"]
+        group_id = event.get_group_id()
+        sender_id = event.get_sender_id()
+        if (
+            (sender_limit <= 0 and group_limit <= 0)
+            or sender_id == event.get_self_id()
+            or not event.message_str
+        ):
+            return
+        if group_id not in dup_conf["whitelist"]:
+            return
+        # 归一化后再取指纹，增删空格、标点、大小写的变体视为同一内容
+        content = normalize_text(event.message_str)
+        if len(content) < dup_conf["min_length"]:
+            return
+        hits = self.duplicate_detector.hit(
+            group_id,
+            sender_id,
+            hash(content),
+            str(event.message_obj.message_id),
+            sender_limit,
+            group_limit,
+        )
+        if not hits:
+            return
+
+        client = event.bot
+        sem = asyncio.Semaphore(10)
+
+        async def try_delete(message_id: str):
+            async with sem:
+                try:
+                    await client.delete_msg(message_id=int(message_id))
+                except Exception:
+                    pass
+
+        await asyncio.gather(*(try_delete(mid) for _, mid in hits))
+
+        senders = list(dict.fromkeys(uid for uid, _ in hits))
+        if dup_conf["ban_time"] > 0:
+            for uid in senders:
                 try:
-                    await event.bot.set_group_ban(
+                    await client.set_group_ban(
                         group_id=int(group_id),
-                        user_id=int(sender_id),
-                        duration=self.conf["spamming"]["ban_time"],
+                        user_id=int(uid),
+                        duration=dup_conf["ban_time"],
                     )
-                    nickname = await get_nickname(event, sender_id)
-                    yield event.plain_result(f"检测到{nickname}刷屏，已禁言")
                 except Exception:
                     logger.error(f"bot在群{group_id}权限不足，禁言失败")
-                timestamps.clear()
+        if len(senders) == 1:
+            nickname = await get_nickname(event, senders[0])
+            yield event.plain_result(f"检测到{nickname}重复发送相同内容，已撤回并禁言")
+        else:
+            yield event.plain_result(
+                f"检测到{len(senders)}人发送相同内容，已撤回{len(hits)}条消息"
+            )
+
+    @filter.platform_adapter_type(filter.PlatformAdapterType.AIOCQHTTP)
+    @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
+    async def flood_whole_ban(self, event: AiocqhttpMessageEvent):
+        """群消息总量过快时开启全员禁言，冷却后自动解除"""
+        flood_conf = self.conf["flood"]
+        threshold = flood_conf["threshold"]
+        group_id = event.get_group_id()
+        if threshold <= 0 or event.get_sender_id() == event.get_self_id():
+            return
+        if group_id not in flood_conf["whitelist"]:
+            return
+        if group_id in self._flood_ban_tasks:
+            return
+        if self.flood_tracker.hit(group_id, time.time()) < threshold:
+            return
+
+        # 先登记任务再调用接口，防止并发消息重复触发
+        self.flood_tracker.reset(group_id)
+        self._flood_ban_tasks[group_id] = asyncio.create_task(
+            self._flood_whole_ban(event.bot, group_id, flood_conf["mute_time"])
+        )
+
+    async def _flood_whole_ban(self, client: CQHttp, group_id: str, mute_time: int):
+        """开启刷屏触发的全员禁言，冷却结束（或插件停用）时解除"""
+        try:
+            try:
+                await client.set_group_whole_ban(group_id=int(group_id), enable=True)
+            except Exception as e:
+                logger.error(f"bot在群{group_id}开启全员禁言失败：{e}")
+                return
+            logger.warning(f"群{group_id}消息速率过高，已开启全员禁言{mute_time}秒")
+            # 禁言已生效，之后无论公告是否发出都要按时解除
+            try:
+                try:
+                    await client.send_group_msg(
+                        group_id=int(group_id),
+                        message=f"检测到本群消息刷屏，已开启全员禁言，{mute_time}秒后自动解除",
+                    )
+                except Exception as e:
+                    logger.warning(f"群{group_id}刷屏禁言公告发送失败：{e}")
+                await asyncio.sleep(mute_time)
+            finally:
+                # 宵禁期间保持全员禁言
+                curfew = self.curfew_mgr.get_task(group_id) if self.curfew_mgr else None
+                if not (curfew and curfew.whole_ban_status):
+                    try:
+                        await client.set_group_whole_ban(
+                            group_id=int(group_id), enable=False
+                        )
+                        logger.info(f"群{group_id}刷屏全员禁言已解除")
+                    except Exception as e:
+                        logger.error(f"群{group_id}解除全员禁言失败：{e}")
+        finally:
+            self._flood_ban_tasks.pop(group_id, None)
 
     @filter.command("设置群头像")
     @perm_required(PermLevel.ADMIN)
@@ -507,34 +781,25 @@ class AdminPlugin(Star):
         yield event.image_result(url)
         # TODO 做张好看的图片来展示
 
-    @filter.platform_adapter_type(filter.PlatformAdapterType.AIOCQHTTP)
-    @filter.event_message_type(filter.EventMessageType.ALL, priority=1)
-    def init_curfew_manager(self, event: AiocqhttpMessageEvent):
-        "延时初始化宵禁管理器（不优雅的方案）"
-        if not self.curfew_mgr and hasattr(event, "bot"):
-            self.curfew_mgr = CurfewManager(event.bot)
-
     @filter.command("开启宵禁")
     @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
     @perm_required(PermLevel.ADMIN)
-    async def start_curfew(
-        self,
-        event: AiocqhttpMessageEvent,
-        input_start_time: str | None = None,
-        input_end_time: str | None = None,
-    ):
-        """开启宵禁 00:00 23:59"""
+    async def start_curfew(self, event: AiocqhttpMessageEvent):
+        """开启宵禁 [星期范围] HH:MM HH:MM [HH:MM HH:MM ...]"""
         group_id = event.get_group_id()
-        if not input_start_time or not input_end_time:
+        tokens = event.message_str.removeprefix("开启宵禁").split()
+        if not tokens:
             yield event.plain_result("未输入范围 HH:MM HH:MM")
             return
-        start_time_str = input_start_time.strip().replace("：", ":")
-        end_time_str = (input_end_time).strip().replace("：", ":")
-        if self.curfew_mgr:
-            await self.curfew_mgr.enable_curfew(group_id, start_time_str, end_time_str)
-            yield event.plain_result(f"本群宵禁创建：{start_time_str}~{end_time_str}")
-        else:
-            event.plain_result("宵禁管理器未初始化")
+        try:
+            schedule = CurfewSchedule.parse(tokens)
+        except ValueError as e:
+            yield event.plain_result(str(e))
+            return
+        # 平台就绪前收到命令时直接用当前连接初始化
+        curfew_mgr = self._create_curfew_manager(event.bot)
+        await curfew_mgr.enable_curfew(group_id, schedule)
+        yield event.plain_result(f"本群宵禁创建：{schedule}")
 
     @filter.command("关闭宵禁")
     @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
@@ -542,15 +807,12 @@ class AdminPlugin(Star):
     async def stop_curfew(self, event: AiocqhttpMessageEvent):
         """取消宵禁任务"""
         group_id = event.get_group_id()
-        if self.curfew_mgr:
-            result = await self.curfew_mgr.disable_curfew(group_id)
-            if result:
-                yield event.plain_result("本群宵禁任务已取消")
-            else:
-                yield event.plain_result("本群没有宵禁任务")
-            event.stop_event()
+        curfew_mgr = self._create_curfew_manager(event.bot)
+        if await curfew_mgr.disable_curfew(group_id):
+            yield event.plain_result("本群宵禁任务已取消")
         else:
-            event.plain_result("宵禁管理器未初始化")
+            yield event.plain_result("本群没有宵禁任务")
+        event.stop_event()
 
     @filter.command("添加进群关键词")
     @perm_required(PermLevel.ADMIN)
@@ -649,21 +911,62 @@ class AdminPlugin(Star):
             return
         yield event.plain_result(f"本群的进群黑名单：{ids}")
 
+    @filter.command("添加全局黑名单")
+    @perm_required(PermLevel.MEMBER)
+    async def add_global_reject_ids(self, event: AiocqhttpMessageEvent):
+        """添加ID到全局进群黑名单，对所有群的进群申请生效"""
+        ids = list(dict.fromkeys(event.message_str.strip().split()[1:]))
+        if not ids:
+            yield event.plain_result("请提供至少一个用户ID。")
+            return
+        self.group_join_manager.add_global_reject_ids(ids)
+        reply = f"全局黑名单新增ID：{ids}"
+        if not self.group_join_manager.global_blacklist:
+            reply += "\n（全局黑名单未启用，需在插件配置中开启）"
+        yield event.plain_result(reply)
+
+    @filter.command("删除全局黑名单")
+    @perm_required(PermLevel.MEMBER)
+    async def remove_global_reject_ids(self, event: AiocqhttpMessageEvent):
+        """从全局进群黑名单中删除指定ID"""
+        ids = list(dict.fromkeys(event.message_str.strip().split()[1:]))
+        if not ids:
+            yield event.plain_result("请提供至少一个用户ID。")
+            return
+        self.group_join_manager.remove_global_reject_ids(ids)
+        yield event.plain_result(f"已从全局黑名单中删除：{ids}")
+
+    @filter.command("全局黑名单", alias={"查看全局黑名单"})
+    @perm_required(PermLevel.MEMBER)
+    async def view_global_reject_ids(self, event: AiocqhttpMessageEvent):
+        """查看全局进群黑名单"""
+        ids = self.group_join_manager.get_global_reject_ids()
+        if not ids:
+            yield event.plain_result("全局黑名单为空")
+            return
+        yield event.plain_result(f"全局黑名单（共{len(ids)}个）：{ids}")
+
+    @filter.command("进群队列", alias={"查看进群队列"})
+    @perm_required(PermLevel.MEMBER)
+    async def view_join_queue(self, event: AiocqhttpMessageEvent):
+        """查看等待自动审核的进群申请数"""
+        group_depth = self.join_queue.depth(event.get_group_id())
+        total = self.join_queue.depth()
+        yield event.plain_result(
+            f"本群有 {group_depth} 条进群申请等待自动审核（所有群共 {total} 条）"
+        )
+
     @filter.command("批准", alias={"同意进群"})
     @perm_required(PermLevel.ADMIN)
-    async def agree_add_group(self, event: AiocqhttpMessageEvent, extra: str = ""):
-        """批准进群申请"""
-        reply = await self.approve(event=event, extra=extra, approve=True)
-        if reply:
-            yield event.plain_result(reply)
+    async def agree_add_group(self, event: AiocqhttpMessageEvent):
+        """(引用进群申请)批准 | 批准 @某人/QQ号 | 批准 全部"""
+        yield event.plain_result(await self._resolve_join_requests(event, True))
 
     @filter.command("驳回", alias={"拒绝进群", "不批准"})
     @perm_required(PermLevel.ADMIN)
-    async def refuse_add_group(self, event: AiocqhttpMessageEvent, extra: str = ""):
-        """驳回进群申请"""
-        reply = await self.approve(event=event, extra=extra, approve=False)
-        if reply:
-            yield event.plain_result(reply)
+    async def refuse_add_group(self, event: AiocqhttpMessageEvent):
+        """(引用进群申请)驳回 理由 | 驳回 @某人/QQ号 理由 | 驳回 全部 理由"""
+        yield event.plain_result(await self._resolve_join_requests(event, False))
 
     @filter.platform_adapter_type(filter.PlatformAdapterType.AIOCQHTTP)
     @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
@@ -676,6 +979,18 @@ class AdminPlugin(Star):
         client = event.bot
         group_id: int = raw.get("group_id", 0)
         user_id: int = raw.get("user_id", 0)
+        # 群管理变动、进退群时使权限缓存失效（bot自己进退群则整群失效）
+        notice_type = raw.get("notice_type")
+        if raw.get("post_type") == "notice" and notice_type in (
+            "group_admin",
+            "group_decrease",
+            "group_increase",
+        ):
+            perm_mgr = PermissionManager.get_instance()
+            if notice_type != "group_admin" and str(user_id) == event.get_self_id():
+                perm_mgr.invalidate(group_id)
+            else:
+                perm_mgr.invalidate(group_id, user_id)
         # 进群申请事件
         if (
             self.conf["enable_audit"]
@@ -683,34 +998,18 @@ class AdminPlugin(Star):
             and raw.get("request_type") == "group"
             and raw.get("sub_type") == "add"
         ):
-            comment = raw.get("comment")
-            flag = raw.get("flag", "")
-            nickname = (await client.get_stranger_info(user_id=user_id))[
-                "nickname"
-            ] or "未知昵称"
-            reply = f"【进群申请】批准/驳回：\n昵称：{nickname}\nQQ：{user_id}\nflag：{flag}"
-            if comment:
-                reply += f"\n{comment}"
-            if self.conf["admin_audit"]:
-                await self._send_admin(client, reply)
-            else:
-                yield event.plain_result(reply)
-
-            reason = self.group_join_manager.reject_reason(
-                str(group_id), str(user_id), comment
+            req = JoinRequest(
+                client,
+                str(group_id),
+                str(user_id),
+                raw.get("comment"),
+                raw.get("flag", ""),
             )
-            if reason:
-                await client.set_group_add_request(
-                    flag=flag, sub_type="add", approve=False, reason=reason,
-                )
-                yield event.plain_result(f"{reason}，已自动拒绝进群")
-            elif comment and self.group_join_manager.should_approve(
-                str(group_id), comment
-            ):
-                await client.set_group_add_request(
-                    flag=flag, sub_type="add", approve=True
-                )
-                yield event.plain_result("验证通过，已自动同意进群")
+            # 放入队列后立即返回，由工作协程逐条处理；
+            # 积压已满时不做自动审核，直接通知并登记，留给管理员手动处理
+            if not self.join_queue.put(req):
+                req.nickname = await self.nickname_cache.get(client, user_id)
+                await self._post_join_notice(req)
 
         # 主动退群事件
         elif (
@@ -719,12 +1018,13 @@ class AdminPlugin(Star):
             and raw.get("notice_type") == "group_decrease"
             and raw.get("sub_type") == "leave"
         ):
-            nickname = (await client.get_stranger_info(user_id=user_id))[
-                "nickname"
-            ] or "未知昵称"
-            reply = f"{nickname}({user_id}) 主动退群了"
+            nickname_task = asyncio.create_task(
+                self.nickname_cache.get(client, user_id)
+            )
             if self.conf["auto_black"]:
                 self.group_join_manager.blacklist_on_leave(str(group_id), str(user_id))
+            reply = f"{await nickname_task}({user_id}) 主动退群了"
+            if self.conf["auto_black"]:
                 reply += "，已拉进黑名单"
             yield event.plain_result(reply)
 
@@ -744,31 +1044,127 @@ class AdminPlugin(Star):
                 except Exception:
                     pass
 
-    @staticmethod
-    async def approve(
-        event: AiocqhttpMessageEvent, extra: str = "", approve: bool = True
-    ) -> str | None:
-        """处理进群申请"""
-        text = get_reply_message_str(event)
-        if not text:
-            return "未引用任何【进群申请】"
-        lines = text.split("\n")
-        if "【进群申请】" in text and len(lines) >= 4:
-            nickname = lines[1].split("：")[1]  # 第2行冒号后文本为nickname
-            flag = lines[3].split("：")[1]  # 第4行冒号后文本为flag
+    async def _process_join_request(self, req: JoinRequest):
+        """处理一条进群申请：自动审核并发送通知"""
+        client = req.client
+        # 昵称只用于通知，与审核判定并行查询，不阻塞自动审核
+        nickname_task = asyncio.create_task(
+            self.nickname_cache.get(client, req.user_id)
+        )
+        result = None
+        try:
+            reason = self.group_join_manager.reject_reason(
+                req.group_id, req.user_id, req.comment
+            )
+            if reason:
+                await self._join_request_limiter.acquire()
+                await client.set_group_add_request(
+                    flag=req.flag, sub_type="add", approve=False, reason=reason,
+                )
+                result = f"{reason}，已自动拒绝进群"
+            elif req.comment and self.group_join_manager.should_approve(
+                req.group_id, req.comment
+            ):
+                await self._join_request_limiter.acquire()
+                await client.set_group_add_request(
+                    flag=req.flag, sub_type="add", approve=True
+                )
+                result = "验证通过，已自动同意进群"
+        except Exception as e:
+            # 自动审核失败时按未处理的申请通知管理员
+            logger.error(f"自动审核 {req.user_id} 的进群申请失败: {e}")
+        finally:
+            req.nickname = await nickname_task
+
+        await self._post_join_notice(req, pending=not result)
+        if result:
+            await client.send_group_msg(group_id=int(req.group_id), message=result)
+
+    async def _post_join_notice(self, req: JoinRequest, pending: bool = True):
+        """
+        发送【进群申请】通知。
+        pending 为 True 时把申请登记到索引，供管理员引用通知或指定QQ号批准/驳回。
+        """
+        client = req.client
+        if pending:
+            self.pending_joins.add(req)
+        reply = (
+            f"【进群申请】批准/驳回：\n昵称：{req.nickname}\nQQ：{req.user_id}\nflag：{req.flag}"
+        )
+        if req.comment:
+            reply += f"\n{req.comment}"
+        message_ids: list[str] = []
+        if self.conf["admin_audit"]:
+            message_ids = await self._send_admin(client, reply)
+        else:
             try:
-                await event.bot.set_group_add_request(
-                    flag=flag, sub_type="add", approve=approve, reason=extra
+                sent = await client.send_group_msg(
+                    group_id=int(req.group_id), message=reply
                 )
-                if approve:
-                    reply = f"已同意{nickname}进群"
-                else:
-                    reply = f"已拒绝{nickname}进群" + (
-                        f"\n理由：{extra}" if extra else ""
-                    )
-                return reply
-            except Exception:
-                return "这条申请处理过了或者格式不对"
+                if sent and sent.get("message_id") is not None:
+                    message_ids.append(str(sent["message_id"]))
+            except Exception as e:
+                logger.error(f"群 {req.group_id} 进群申请通知发送失败: {e}")
+        if pending:
+            for message_id in message_ids:
+                self.pending_joins.bind_message(message_id, req)
+
+    async def _resolve_join_requests(
+        self, event: AiocqhttpMessageEvent, approve: bool
+    ) -> str:
+        """
+        按引用的通知、指定的QQ号或“全部”从索引中找到申请并批准/驳回。
+        引用了通知或使用“全部”时，其余文字都作为理由；只有未引用时才把纯数字当作QQ号。
+        """
+        group_id = event.get_group_id()
+        args = event.message_str.split()[1:]
+        reason = " ".join(args)
+
+        if args and args[0] == "全部":
+            reason = " ".join(args[1:])
+            requests = self.pending_joins.pending(group_id)
+        elif reply_id := get_reply_id(event):
+            req = self.pending_joins.get_by_message(reply_id)
+            requests = [req] if req else []
+        elif user_ids := get_ats(event) + [arg for arg in args if arg.isdigit()]:
+            reason = " ".join(arg for arg in args if not arg.isdigit())
+            requests = [
+                req
+                for uid in dict.fromkeys(user_ids)
+                if (req := self.pending_joins.get(group_id, uid))
+            ]
+        else:
+            return "请引用【进群申请】通知，或指定QQ号，或使用“全部”"
+        if not requests:
+            return "没有找到待处理的进群申请（可能已处理或已过期）"
+
+        async def handle(req: JoinRequest) -> bool:
+            await self._join_request_limiter.acquire()
+            # 无论成功与否都移出索引：失败通常意味着申请已被处理或已失效
+            self.pending_joins.discard(req)
+            try:
+                await req.client.set_group_add_request(
+                    flag=req.flag, sub_type="add", approve=approve, reason=reason
+                )
+                return True
+            except Exception as e:
+                logger.warning(f"处理 {req.user_id} 的进群申请失败: {e}")
+                return False
+
+        results = await asyncio.gather(*(handle(req) for req in requests))
+        done = [req for req, ok in zip(requests, results) if ok]
+        action = "同意" if approve else "拒绝"
+        if len(requests) == 1:
+            if not done:
+                return "这条申请处理过了或已失效"
+            reply = f"已{action}{done[0].nickname}进群"
+        else:
+            reply = f"已{action}{len(done)}人进群"
+            if failed := len(requests) - len(done):
+                reply += f"，{failed}条申请处理过了或已失效"
+        if not approve and reason:
+            reply += f"\n理由：{reason}"
+        return reply
 
     @filter.command("群友信息")
     @perm_required(PermLevel.MEMBER)
@@ -864,7 +1260,9 @@ class AdminPlugin(Star):
                 msg_list = []
                 for clear_id in clear_ids:
                     try:
-                        target_name = await get_nickname(event, user_id=clear_id)
+                        info = await get_member_info(event.bot, group_id, clear_id)
+                        target_name = info.get("card") or info.get("nickname")
+                        self.nickname_cache.put(clear_id, info.get("nickname"))
                         await event.bot.set_group_kick(
                             group_id=int(group_id),
                             user_id=int(clear_id),
@@ -896,7 +1294,20 @@ class AdminPlugin(Star):
 
     async def terminate(self):
         """可选择实现异步的插件销毁方法，当插件被卸载/停用时会调用。"""
+        # 提前解除刷屏触发的全员禁言，避免插件停用后群一直处于禁言状态
+        for task in list(self._flood_ban_tasks.values()):
+            task.cancel()
+        await asyncio.gather(
+            *self._flood_ban_tasks.values(), return_exceptions=True
+        )
+        await self.join_queue.stop()
         # 停止所有宵禁任务进程
+        if self._curfew_init_task and not self._curfew_init_task.done():
+            self._curfew_init_task.cancel()
         if self.curfew_mgr:
             await self.curfew_mgr.stop_all_tasks()
+        # 写出尚未落盘的进群审核数据
+        await self.group_join_manager.flush()
+        if self.store:
+            self.store.close()
         logger.info("插件 astrbot_plugin_QQAdmin 已被终止。")